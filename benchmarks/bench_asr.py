@@ -0,0 +1,71 @@
+"""
+Single pass whisper transcription against silence-split chunks transcribed in parallel worker processes, e.g.
+
+    python -m benchmarks.bench_asr --model tiny --workers 4 --audio assets/test.mp3
+
+Needs openai-whisper (and torch) installed.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import whisper
+from whisper.audio import SAMPLE_RATE
+
+from yuisub.a2t import WhisperModel, split_on_silence
+
+ASSET = Path(__file__).resolve().parent.parent / "assets" / "test.mp3"
+
+
+async def _chunked(model_name: str, device: Optional[str], audio: str, workers: int, repeat: int) -> List[float]:
+    model = WhisperModel(name=model_name, device=device)
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+    samples = whisper.load_audio(audio)
+    chunks = split_on_silence(samples)
+    print(f"{len(chunks)} chunks, {sum(e - s for s, e in chunks) / len(samples):.0%} of the audio is speech")
+
+    times = []
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            await model.atranscribe_chunked(samples, executor=executor, verbose=None)
+            times.append(time.perf_counter() - t)
+    finally:
+        executor.shutdown()
+    return times
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chunked parallel transcription")
+    parser.add_argument("--audio", type=str, default=str(ASSET))
+    parser.add_argument("--model", type=str, default="tiny")
+    parser.add_argument("--device", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--repeat", type=int, default=2, help="chunked runs, the first one loads the worker models")
+    args = parser.parse_args(argv)
+
+    model = WhisperModel(name=args.model, device=args.device)
+    samples = whisper.load_audio(args.audio)
+    print(f"{args.audio}: {len(samples) / SAMPLE_RATE:.1f}s of audio, model {args.model}")
+
+    # load the model outside of the timing, like a warm worker
+    _ = model.model
+    t = time.perf_counter()
+    single = model.transcribe(samples, verbose=None)
+    single_time = time.perf_counter() - t
+    print(f"single pass: {single_time:.2f}s, {len(single)} events")
+
+    times = asyncio.run(_chunked(args.model, args.device, args.audio, args.workers, args.repeat))
+    for i, chunked_time in enumerate(times):
+        label = "cold" if i == 0 else "warm"
+        print(f"chunked x{args.workers} ({label}): {chunked_time:.2f}s, speedup {single_time / chunked_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Time and memory of building the Chinese and bilingual subtitles of a big karaoke/typesetting file, e.g.
+
+    python -m benchmarks.bench_compose --events 10000,50000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from copy import deepcopy
+from typing import Callable, List, Optional, Tuple
+
+import pysubs2
+from pysubs2 import SSAEvent, SSAFile
+
+from yuisub.sub import PRESET_STYLES, compose
+
+
+def karaoke_sub(events: int) -> SSAFile:
+    """
+    ASS file of `events` karaoke syllable and typesetting events
+
+    :param events: number of events
+    :return: pysubs2.SSAFile
+    """
+    sub = SSAFile()
+    for i in range(events):
+        if i % 3:
+            text = "".join(f"{{\\k{10 + j}}}syl{j} " for j in range(8))
+        else:
+            text = f"{{\\an8\\pos({i % 1280},{i % 720})\\fad(100,100)}}sign {i}"
+        sub.append(SSAEvent(start=i * 100, end=i * 100 + 2000, text=text, layer=i % 4, effect="karaoke"))
+    return sub
+
+
+def legacy(sub: SSAFile, texts: List[str]) -> Tuple[SSAFile, SSAFile]:
+    # the translate() + bilingual() output path before compose(): deepcopy, then restyle the origin in place
+    sub_zh = SSAFile()
+    sub_zh.styles = PRESET_STYLES
+    for e, text in zip(deepcopy(sub.events), texts):
+        e.style = "zh"
+        e.text = text
+        sub_zh.append(e)
+
+    sub_bilingual = SSAFile()
+    sub_bilingual.styles = PRESET_STYLES
+    for e in sub:
+        e.style = "origin"
+        sub_bilingual.append(e)
+    for e in sub_zh:
+        sub_bilingual.append(e)
+    return sub_zh, sub_bilingual
+
+
+def measure(build: Callable[[SSAFile, List[str]], Tuple[SSAFile, SSAFile]], events: int) -> Tuple[float, float]:
+    """
+    :return: seconds and tracemalloc peak in MB of one build
+    """
+    sub = karaoke_sub(events)
+    texts = [f"译:{e.text}" for e in sub]
+    gc.collect()
+
+    tracemalloc.start()
+    t = time.perf_counter()
+    build(sub, texts)
+    elapsed = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # tracemalloc slows allocation down, time once more without it
+    t = time.perf_counter()
+    build(sub, texts)
+    return min(elapsed, time.perf_counter() - t), peak / 1024 / 1024
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark building the zh and bilingual subtitles")
+    parser.add_argument("--events", type=str, default="10000,50000", help="comma separated file sizes")
+    args = parser.parse_args(argv)
+
+    print(f"pysubs2 {pysubs2.__version__}")
+    print(" events  legacy(s)  compose(s)  legacy(MB)  compose(MB)")
+    for events in (int(e) for e in args.events.split(",")):
+        legacy_time, legacy_peak = measure(legacy, events)
+        compose_time, compose_peak = measure(lambda sub, texts: compose(sub, texts), events)
+        print(f"{events:>7} {legacy_time:>10.3f} {compose_time:>11.3f} {legacy_peak:>11.1f} {compose_peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
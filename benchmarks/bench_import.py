@@ -0,0 +1,69 @@
+"""
+Startup time of `import yuisub` and `yuisub -h` on top of a bare interpreter, from `python -X importtime` of fresh
+interpreters, e.g.
+
+    python -m benchmarks.bench_import --budget 50
+
+Exits with 1 when the median of a command is over the budget, so it can guard startup in CI.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# what the lazy imports keep out of `import yuisub` and `yuisub -h`
+HEAVY_MODULES = ("openai", "httpx", "pydantic", "pysubs2", "tenacity", "torch", "whisper")
+
+COMMANDS = {
+    "import yuisub": ["-c", "import yuisub"],
+    "yuisub -h": ["-m", "yuisub", "-h"],
+}
+
+
+def import_times(args: List[str]) -> Dict[str, float]:
+    """
+    Run python -X importtime in a new interpreter
+
+    :param args: python arguments after -X importtime
+    :return: cumulative import time of every imported module in ms, the top-level ones under "total" too
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True, check=False)
+    times = {"total": 0.0}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+        # nested imports are indented under their parent
+        if not name[1:].startswith(" "):
+            times["total"] += int(cumulative) / 1000
+    return times
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark yuisub startup")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=None, help="fail when a median is over this many ms")
+    args = parser.parse_args(argv)
+
+    # site, encodings and friends, paid by any python process
+    baseline = statistics.median(import_times(["-c", "pass"])["total"] for _ in range(args.repeat))
+    print(f"{'python':<14} {baseline:>8.1f}ms")
+
+    over = False
+    for label, command in COMMANDS.items():
+        runs = [import_times(command) for _ in range(args.repeat)]
+        median = statistics.median(times["total"] for times in runs) - baseline
+        heavy = [m for m in HEAVY_MODULES if m in runs[0]]
+        print(f"{label:<14} {median:>+8.1f}ms  heavy imports: {', '.join(heavy) or 'none'}")
+        over = over or (args.budget is not None and median > args.budget)
+
+    if over:
+        print(f"over the {args.budget}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
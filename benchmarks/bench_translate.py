@@ -0,0 +1,226 @@
+"""
+Offline benchmark of the translation pipeline against the mock llm and bangumi servers, e.g.
+
+    python -m benchmarks.bench_translate --events 100,1000,10000 --batch-size 8 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+import pysubs2
+from pydantic import BaseModel
+
+from benchmarks.mock_server import MockServer
+from yuisub import SubtitleTranslator, TranslationStats
+
+WORDS = "the quick brown fox jumps over a lazy dog while we wait for the train to come home tonight".split()
+
+
+class BenchResult(BaseModel):
+    events: int
+    batch_size: int
+    max_concurrency: int
+    wall: float
+    events_per_second: float
+    latency_p50: float
+    latency_p99: float
+    requests: int
+    retries: int
+    server_requests: int
+    server_errors: int
+    server_rate_limited: int
+    peak_in_flight: int
+    failed_lines: int
+    peak_traced_mb: float
+    max_rss_mb: float
+
+
+def synthetic_sub(events: int, repeat: float = 0.2, seed: int = 0) -> pysubs2.SSAFile:
+    """
+    Subtitle with `events` dialogue lines, a share of them repeated like the stock phrases of a real episode
+
+    :param events: number of events
+    :param repeat: share of lines repeating an earlier one
+    :param seed: random seed
+    :return: pysubs2.SSAFile
+    """
+    rng = random.Random(seed)
+    sub = pysubs2.SSAFile()
+    texts: List[str] = []
+    for i in range(events):
+        if texts and rng.random() < repeat:
+            text = rng.choice(texts)
+        else:
+            text = " ".join(rng.choices(WORDS, k=rng.randint(3, 12))).capitalize() + "."
+            texts.append(text)
+        sub.append(pysubs2.SSAEvent(start=i * 2000, end=i * 2000 + 1800, text=text))
+    return sub
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(
+    events: int,
+    batch_size: int = 1,
+    max_concurrency: int = 16,
+    latency: float = 0.2,
+    jitter: float = 0.5,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    repeat: float = 0.2,
+    bangumi: bool = True,
+    seed: int = 0,
+    trace_memory: bool = False,
+    **kwargs: Any,
+) -> BenchResult:
+    """
+    Translate one synthetic episode through SubtitleTranslator.get_subtitles against a fresh mock server
+
+    :param events: number of subtitle events
+    :param batch_size: SubtitleTranslator batch_size
+    :param max_concurrency: SubtitleTranslator max_concurrency
+    :param latency: median mock completion latency in seconds
+    :param jitter: sigma of the lognormal mock latency
+    :param error_rate: share of 500 answers
+    :param rate_limit_rate: share of 429 answers
+    :param repeat: share of repeated lines in the synthetic subtitle
+    :param bangumi: fetch bangumi info from the stub server, the summary request is sent either way
+    :param seed: random seed
+    :param trace_memory: report the tracemalloc peak, slows the run down noticeably
+    :param kwargs: passed to SubtitleTranslator
+    :return: BenchResult
+    """
+    sub = synthetic_sub(events, repeat=repeat, seed=seed)
+    stats = TranslationStats()
+
+    async with MockServer(
+        latency=latency, jitter=jitter, error_rate=error_rate, rate_limit_rate=rate_limit_rate, seed=seed
+    ) as server:
+        translator = SubtitleTranslator(
+            model="mock",
+            api_key="mock",
+            base_url=server.base_url,
+            bangumi_url="https://bangumi.tv/subject/424883" if bangumi else None,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            **kwargs,
+        )
+        translator.bangumi_client = server.bangumi_client()
+
+        if trace_memory:
+            tracemalloc.start()
+        t = time.perf_counter()
+        async with translator:
+            await translator.get_subtitles(sub=sub, stats=stats)
+        wall = time.perf_counter() - t
+        _, peak = tracemalloc.get_traced_memory()
+        if trace_memory:
+            tracemalloc.stop()
+
+    # ru_maxrss is KiB on linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    return BenchResult(
+        events=events,
+        batch_size=batch_size,
+        max_concurrency=max_concurrency,
+        wall=wall,
+        events_per_second=events / wall,
+        latency_p50=percentile(stats.request_latency, 0.5),
+        latency_p99=percentile(stats.request_latency, 0.99),
+        requests=stats.requests,
+        retries=stats.retries,
+        server_requests=server.stats.requests,
+        server_errors=server.stats.errors,
+        server_rate_limited=server.stats.rate_limited,
+        peak_in_flight=server.stats.peak_in_flight,
+        failed_lines=stats.failed_lines,
+        peak_traced_mb=peak / 1024 / 1024,
+        max_rss_mb=max_rss,
+    )
+
+
+def _table(results: List[BenchResult]) -> str:
+    columns: Dict[str, str] = {
+        "events": "{:>7}",
+        "batch_size": "{:>5}",
+        "wall": "{:>8.2f}",
+        "events_per_second": "{:>9.1f}",
+        "latency_p50": "{:>7.3f}",
+        "latency_p99": "{:>7.3f}",
+        "requests": "{:>8}",
+        "retries": "{:>7}",
+        "server_requests": "{:>8}",
+        "server_errors": "{:>6}",
+        "server_rate_limited": "{:>5}",
+        "peak_in_flight": "{:>6}",
+        "failed_lines": "{:>6}",
+        "peak_traced_mb": "{:>8.1f}",
+        "max_rss_mb": "{:>8.1f}",
+    }
+    header = "events batch   wall(s)  events/s     p50     p99 requests retries  server    5xx   429 flight failed  peak(MB)   rss(MB)"
+    rows = [" ".join(fmt.format(getattr(r, k)) for k, fmt in columns.items()) for r in results]
+    return "\n".join([header, *rows])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline yuisub translation benchmark")
+    parser.add_argument("--events", type=str, default="100,1000,10000", help="comma separated episode sizes")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="median completion latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="sigma of the lognormal latency, 0 for constant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 answers")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429 answers")
+    parser.add_argument("--repeat", type=float, default=0.2, help="share of repeated lines")
+    parser.add_argument(
+        "--no-bangumi", action="store_true", help="skip the bangumi lookup, the summary is still requested"
+    )
+    parser.add_argument("--context-size", type=int, default=0)
+    parser.add_argument("--hedge", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="report the tracemalloc peak, slower")
+    parser.add_argument("--json", action="store_true", help="print one json result per line")
+    args = parser.parse_args(argv)
+
+    results = []
+    for events in (int(e) for e in args.events.split(",")):
+        result = asyncio.run(
+            run(
+                events,
+                batch_size=args.batch_size,
+                max_concurrency=args.max_concurrency,
+                latency=args.latency,
+                jitter=args.jitter,
+                error_rate=args.error_rate,
+                rate_limit_rate=args.rate_limit_rate,
+                repeat=args.repeat,
+                bangumi=not args.no_bangumi,
+                seed=args.seed,
+                trace_memory=args.trace_memory,
+                context_size=args.context_size,
+                hedge=args.hedge,
+            )
+        )
+        results.append(result)
+        if args.json:
+            print(json.dumps(result.model_dump()))
+
+    if not args.json:
+        print(_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import random
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+BANGUMI_CHARACTERS = 120
+
+
+class ServerStats(BaseModel):
+    requests: int = 0
+    completions: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    bangumi: int = 0
+    peak_in_flight: int = 0
+
+
+class MockServer:
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        bangumi_latency: float = 0.05,
+        seed: int = 0,
+    ) -> None:
+        """
+        Local fake of an OpenAI compatible chat completions server and of api.bgm.tv, plain asyncio HTTP/1.1
+        with keep-alive, so the benchmark goes through the real openai/httpx client stack
+
+        :param latency: median completion latency in seconds
+        :param jitter: sigma of the lognormal latency distribution, 0 for a constant latency
+        :param error_rate: share of completions answered with 500
+        :param rate_limit_rate: share of completions answered with 429
+        :param retry_after: Retry-After header of 429 answers
+        :param bangumi_latency: latency of bangumi api answers
+        :param seed: random seed
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.bangumi_latency = bangumi_latency
+        self.random = random.Random(seed)
+        self.stats = ServerStats()
+        self.port = 0
+        self._in_flight = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def __aenter__(self) -> "MockServer":
+        self._server = await asyncio.start_server(self._connection, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def bangumi_client(self) -> httpx.AsyncClient:
+        """
+        Client for yuisub.bangumi whose api.bgm.tv requests land on this server
+        """
+        return httpx.AsyncClient(transport=_Rewrite(self.port), timeout=30.0)
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                status, extra, payload = await self._handle(method, path, body)
+
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                head = f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                head += f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in extra.items())
+                writer.write(head.encode("latin-1") + b"\r\n" + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        self.stats.requests += 1
+        if path.startswith("/v0/"):
+            self.stats.bangumi += 1
+            await asyncio.sleep(self.bangumi_latency)
+            return 200, {}, _bangumi(path)
+
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return 404, {}, {"error": {"message": f"{method} {path} not found"}}
+
+        self._in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self._in_flight)
+        try:
+            latency = self.latency * (self.random.lognormvariate(0, self.jitter) if self.jitter else 1.0)
+            await asyncio.sleep(latency)
+
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.stats.rate_limited += 1
+                return 429, {"Retry-After": str(self.retry_after)}, {"error": {"message": "rate limited"}}
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats.errors += 1
+                return 500, {}, {"error": {"message": "internal error"}}
+
+            self.stats.completions += 1
+            request = json.loads(body)
+            question = json.loads(request["messages"][-1]["content"])
+            origin = question["origin"]
+            zh: Any = [f"译:{o}" for o in origin] if isinstance(origin, list) else f"译:{origin}"
+            prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 4
+            return (
+                200,
+                {},
+                {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": json.dumps({"zh": zh}, ensure_ascii=False)},
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(str(zh)),
+                        "total_tokens": prompt_tokens + len(str(zh)),
+                    },
+                },
+            )
+        finally:
+            self._in_flight -= 1
+
+
+def _bangumi(path: str) -> Any:
+    parts = path.strip("/").split("/")
+    if parts[1] == "subjects" and len(parts) == 4:
+        return [
+            {"id": i, "name": f"キャラ{i}", "relation": "主角" if i < 4 else "配角"} for i in range(BANGUMI_CHARACTERS)
+        ]
+    if parts[1] == "subjects":
+        return {"id": int(parts[2]), "summary": "ベンチマーク用のあらすじ。" * 20}
+    return {"id": int(parts[2]), "infobox": [{"key": "简体中文名", "value": f"角色{parts[2]}"}]}
+
+
+class _Rewrite(httpx.AsyncBaseTransport):
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+import pytest
+
+pytest.importorskip("whisper")
+
+from yuisub import a2t
+from yuisub.a2t import AudioCache, MappedAudio, ModelRegistry, WhisperModel
+
+
+class _FakeWhisper:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    def transcribe(self, **kwargs: Any) -> Any:
+        self.calls += 1
+        time.sleep(self.delay)
+        return {"text": "hello", "segments": [{"start": 0.0, "end": 1.0, "text": "hello"}]}
+
+
+def test_registry(monkeypatch: pytest.MonkeyPatch) -> None:
+    loads: List[Any] = []
+
+    def _load_model(**kwargs: Any) -> _FakeWhisper:
+        loads.append(kwargs)
+        return _FakeWhisper()
+
+    monkeypatch.setattr(a2t.whisper, "load_model", _load_model)
+    monkeypatch.setattr(a2t, "registry", ModelRegistry(idle_timeout=0.05))
+
+    first = WhisperModel(name="tiny", device="cpu")
+    second = WhisperModel(name="tiny", device="cpu")
+    other = WhisperModel(name="tiny", device="cpu", shared=False)
+    audio = np.zeros(a2t.SAMPLE_RATE, dtype=np.float32)
+    # loaded lazily, once per key
+    assert loads == []
+    first.transcribe(audio=audio)
+    second.transcribe(audio=audio)
+    assert len(loads) == 1
+    assert first.model is second.model
+    other.transcribe(audio=audio)
+    assert len(loads) == 2
+
+    # unloaded once idle, a new reference before the timeout keeps it
+    first.close()
+    second.close()
+    third = WhisperModel(name="tiny", device="cpu")
+    time.sleep(0.1)
+    assert a2t.registry.loaded() == [("tiny", "cpu", False)]
+    third.close()
+    time.sleep(0.1)
+    assert a2t.registry.loaded() == []
+
+
+async def test_atranscribe(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake = _FakeWhisper(delay=0.05)
+    monkeypatch.setattr(a2t.whisper, "load_model", lambda **kwargs: fake)
+    model = WhisperModel(name="tiny", device="cpu", shared=False)
+    audio = np.zeros(a2t.SAMPLE_RATE * 10, dtype=np.float32)
+
+    # the event loop keeps running while whisper decodes
+    ticks = 0
+
+    async def _tick() -> None:
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.ensure_future(_tick())
+    sub = await model.atranscribe(audio, chunk_length=1.0)
+    ticker.cancel()
+    assert len(sub) == 10
+    assert ticks >= 10
+
+    # a cancelled transcription stops after the current chunk
+    fake.calls = 0
+    task = asyncio.ensure_future(model.atranscribe(audio, chunk_length=1.0))
+    await asyncio.sleep(0.12)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.2)
+    assert fake.calls < 10
+
+
+def test_split_on_silence() -> None:
+    rng = np.random.default_rng(0)
+    sr = a2t.SAMPLE_RATE
+    audio = rng.normal(0, 0.001, sr * 200).astype(np.float32)
+    for start, end in [(10, 40), (40.3, 50), (100, 190)]:
+        audio[int(start * sr) : int(end * sr)] += rng.normal(0, 0.2, int(end * sr) - int(start * sr))
+
+    chunks = [(s / sr, e / sr) for s, e in a2t.split_on_silence(audio, max_chunk_length=60)]
+    # the short pause is bridged, the long silence is skipped, the long region is cut at max_chunk_length
+    assert [round(s) for s, _ in chunks] == [10, 100, 160]
+    assert [round(e) for _, e in chunks] == [50, 160, 190]
+    assert a2t.split_on_silence(np.zeros(0, dtype=np.float32)) == []
+
+
+def test_split_on_silence_continuous() -> None:
+    rng = np.random.default_rng(0)
+    sr = a2t.SAMPLE_RATE
+
+    # no silence at all, the audio is cut at max_chunk_length instead of dropped
+    noise = rng.normal(0, 0.3, sr * 150).astype(np.float32)
+    chunks = a2t.split_on_silence(noise, max_chunk_length=60)
+    assert [(s // sr, e // sr) for s, e in chunks] == [(0, 60), (60, 120), (120, 150)]
+
+    # speech 10dB over a -30dBFS music bed, every other 5 seconds
+    audio = rng.normal(0, 10 ** (-30 / 20), sr * 100).astype(np.float32)
+    for start in range(0, 100, 10):
+        audio[start * sr : (start + 5) * sr] *= 10 ** (10 / 20)
+    chunks = a2t.split_on_silence(audio, max_chunk_length=60)
+    assert [round(s / sr) for s, _ in chunks] == list(range(0, 100, 10))
+    assert [round(e / sr) for _, e in chunks] == list(range(5, 105, 10))
+
+
+async def test_atranscribe_chunked(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake = _FakeWhisper()
+    monkeypatch.setattr(a2t.whisper, "load_model", lambda **kwargs: fake)
+    model = WhisperModel(name="tiny", device="cpu", shared=False)
+
+    sr = a2t.SAMPLE_RATE
+    audio = np.zeros(sr * 100, dtype=np.float32)
+    audio[sr * 20 : sr * 30] = np.random.default_rng(0).normal(0, 0.2, sr * 10)
+    audio[sr * 70 : sr * 75] = np.random.default_rng(1).normal(0, 0.2, sr * 5)
+
+    sub = await model.atranscribe_chunked(audio)
+    # one decode per speech chunk, events back on the timeline of the whole audio
+    assert fake.calls == 2
+    assert [round(e.start / 1000) for e in sub] == [20, 70]
+
+
+def test_audio_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    decoded: List[str] = []
+
+    def _load_audio(path: str) -> np.ndarray:
+        decoded.append(path)
+        return np.linspace(-1, 1, a2t.SAMPLE_RATE, dtype=np.float32)
+
+    monkeypatch.setattr(a2t.whisper, "load_audio", _load_audio)
+    files = []
+    for i in range(3):
+        files.append(tmp_path / f"ep{i}.mp3")
+        files[-1].write_bytes(bytes([i]) * 16)
+
+    # room for two decoded files
+    cache = AudioCache(tmp_path / "cache", max_size=2 * a2t.SAMPLE_RATE * 4)
+    first = cache.load(files[0])
+    assert np.array_equal(cache.load(files[0]), first)
+    assert (len(decoded), cache.hits, cache.misses) == (1, 1, 1)
+
+    # mapped ranges read the same samples as the array
+    mapped = a2t._mapped(first, 100, 200)
+    assert isinstance(mapped, MappedAudio)
+    assert np.array_equal(mapped.open(), first[100:200])
+
+    # the least recently used file is evicted
+    cache.load(files[1])
+    time.sleep(0.01)
+    cache.load(files[0])
+    time.sleep(0.01)
+    cache.load(files[2])
+    assert len(list((tmp_path / "cache").glob("*.pcm"))) == 2
+    cache.load(files[0])
+    assert len(decoded) == 3
+    cache.load(files[1])
+    assert len(decoded) == 4
@@ -1,4 +1,10 @@
-from yuisub import bangumi
+from pathlib import Path
+from typing import List
+
+import httpx
+
+from yuisub import BangumiCache, bangumi
+from yuisub.bangumi import CacheEntry
 
 from . import util
 
@@ -14,3 +20,47 @@ async def test_bangumi() -> None:
         r = await bangumi(url=url, token=util.BANGUMI_ACCESS_TOKEN)
         print(r.introduction)
         print(r.characters)
+
+
+async def test_bangumi_cache(tmp_path: Path) -> None:
+    requests: List[httpx.Request] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"summary": "intro"}, headers={"ETag": '"v1"'})
+
+    url = "https://api.bgm.tv/v0/subjects/424883"
+    cache = BangumiCache(tmp_path, ttl=3600)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(_handler)) as client:
+        assert (await cache.get(client, url)).json() == {"summary": "intro"}
+        assert (tmp_path / "subjects" / "424883.json").exists()
+
+        # fresh, served without network
+        assert (await cache.get(client, url)).json() == {"summary": "intro"}
+        assert len(requests) == 1
+
+        # stale, revalidated with ETag
+        cache.ttl = 0
+        assert (await cache.get(client, url)).json() == {"summary": "intro"}
+        assert len(requests) == 2
+        assert requests[-1].headers["If-None-Match"] == '"v1"'
+
+        # offline
+        cache.offline = True
+        assert (await cache.get(client, url)).json() == {"summary": "intro"}
+        assert (await cache.get(client, url + "/characters")).status_code == 504
+        assert len(requests) == 2
+
+
+async def test_bangumi_cache_outage(tmp_path: Path) -> None:
+    def _handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("api.bgm.tv is down", request=request)
+
+    url = "https://api.bgm.tv/v0/characters/1"
+    cache = BangumiCache(tmp_path, ttl=0)
+    cache.save(CacheEntry(url=url, body={"name": "stale"}, fetched_at=0))
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(_handler)) as client:
+        assert (await cache.get(client, url)).json() == {"name": "stale"}
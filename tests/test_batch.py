@@ -0,0 +1,61 @@
+import shutil
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+from yuisub.batch import SUB_SUFFIXES, Manifest, expand_inputs, is_batch_input, output_stems, translate_batch
+from yuisub.translator import SubtitleTranslator
+
+from . import util
+
+
+def _echo(question: Dict[str, Any]) -> Dict[str, Any]:
+    return {"zh": f"zh:{question['origin']}"}
+
+
+async def test_batch(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    season = tmp_path / "season"
+    season.mkdir()
+    for i in range(3):
+        shutil.copy(util.TEST_ENG_SRT, season / f"ep{i + 1:02d}.srt")
+
+    assert is_batch_input(str(season))
+    assert is_batch_input(str(season / "*.srt"))
+    inputs = expand_inputs(str(season), SUB_SUFFIXES)
+    assert [f.name for f in inputs] == ["ep01.srt", "ep02.srt", "ep03.srt"]
+
+    translator = SubtitleTranslator(
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+    )
+    output = tmp_path / "output"
+    manifest = await translate_batch(translator, inputs, output, jobs=2)
+
+    assert all(e.status == "done" for e in manifest.episodes.values())
+    assert (output / "ep02.zh.ass").exists()
+    assert (output / "ep02.bilingual.ass").exists()
+    assert Manifest.load(output / "yuisub-manifest.json") == manifest
+
+    # resume, nothing left to translate
+    calls = client.calls
+    await translate_batch(translator, inputs, output, jobs=2)
+    assert client.calls == calls
+
+
+def test_output_stems(tmp_path: Path) -> None:
+    inputs = [
+        tmp_path / "S1" / "ep01.mkv",
+        tmp_path / "S2" / "ep01.mkv",
+        tmp_path / "S1" / "ep02.srt",
+        tmp_path / "S1" / "ep02.ass",
+        tmp_path / "S1" / "ep03.mkv",
+    ]
+    stems = output_stems(inputs)
+    # unique stems are kept, the others get the path that tells them apart
+    assert [stems[f] for f in inputs] == ["S1/ep01", "S2/ep01", "ep02.srt", "ep02.ass", "ep03"]
+    assert len(set(stems.values())) == len(inputs)
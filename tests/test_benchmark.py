@@ -0,0 +1,17 @@
+from benchmarks.bench_translate import run, synthetic_sub
+
+
+def test_synthetic_sub() -> None:
+    sub = synthetic_sub(200, repeat=0.5)
+    assert len(sub) == 200
+    assert len({e.text for e in sub}) < 150
+
+
+async def test_benchmark_smoke() -> None:
+    result = await run(50, batch_size=4, latency=0.001, jitter=0, error_rate=0.1, seed=1)
+    assert result.failed_lines == 0
+    assert result.server_errors > 0
+    # one summary request plus the batches, the openai client retries the 500s on its own
+    assert result.requests >= 50 // 4
+    assert result.server_requests > result.requests
+    assert result.latency_p50 <= result.latency_p99
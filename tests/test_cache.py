@@ -0,0 +1,60 @@
+import time
+from pathlib import Path
+
+from yuisub import ORIGIN, TranslationCache, Translator
+
+from . import util
+
+
+def test_cache(tmp_path: Path) -> None:
+    cache = TranslationCache(tmp_path / "translation.db")
+    cache.set("はい", "好的", "model", "prompt")
+
+    assert cache.get(" はい ", "model", "prompt") == "好的"
+    assert cache.get("はい", "other-model", "prompt") is None
+    assert cache.get("はい", "model", "other-prompt") is None
+    assert cache.hits == 1
+    assert cache.misses == 2
+    cache.close()
+
+    # persisted on disk
+    cache = TranslationCache(tmp_path / "translation.db")
+    assert cache.get("はい", "model", "prompt") == "好的"
+    cache.close()
+
+
+def test_cache_evict() -> None:
+    cache = TranslationCache(":memory:", max_entries=2, max_age=60)
+    for i in range(3):
+        cache.set(str(i), str(i), "model", "prompt")
+        time.sleep(0.01)
+
+    cache.get("0", "model", "prompt")
+    cache.evict()
+    assert len(cache) == 2
+    assert cache.get("1", "model", "prompt") is None
+
+    cache.max_age = 0
+    cache.evict()
+    assert len(cache) == 0
+
+
+async def test_cache_translator() -> None:
+    cache = TranslationCache(":memory:")
+    t = Translator(
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        batch_size=4,
+        cache=cache,
+    )
+    client = util.FakeClient(lambda q: {"zh": [f"zh:{o}" for o in q["origin"]]})
+    t.client = client  # type: ignore[assignment]
+
+    questions = [ORIGIN(origin=str(i)) for i in range(4)]
+    await t.ask_batch(questions)
+    res = await t.ask_batch(questions)
+
+    assert [r.zh for r in res] == [f"zh:{i}" for i in range(4)]
+    assert client.calls == 1
+    assert cache.hits == 4
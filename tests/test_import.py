@@ -0,0 +1,25 @@
+import inspect
+
+import pytest
+
+import yuisub
+from benchmarks.bench_import import COMMANDS, HEAVY_MODULES, import_times
+
+
+@pytest.mark.parametrize("label", list(COMMANDS))
+def test_startup_imports(label: str) -> None:
+    times = import_times(COMMANDS[label])
+    assert "yuisub" in times
+    assert [m for m in HEAVY_MODULES if m in times] == []
+
+
+def test_lazy_attributes() -> None:
+    assert set(yuisub.__all__) <= set(dir(yuisub))
+    for name in yuisub.__all__:
+        assert getattr(yuisub, name) is not None
+
+    # the function, not the yuisub.bangumi module
+    assert inspect.iscoroutinefunction(yuisub.bangumi)
+
+    with pytest.raises(AttributeError):
+        _ = yuisub.missing
@@ -1,8 +1,13 @@
+import asyncio
+import json
 import os
+from typing import Any, Dict, List
 
+import httpx
 import pytest
 
-from yuisub import ORIGIN, Summarizer, Translator, bangumi
+from yuisub import BGM, ORIGIN, Endpoint, EndpointPool, Hedger, Summarizer, Translator, bangumi
+from yuisub.prompt import anime_prompt, estimate_tokens, select_characters
 
 from . import util
 
@@ -41,6 +46,90 @@ Thank you for your time.
 )
 
 
+def _echo(question: Dict[str, Any]) -> Dict[str, Any]:
+    if isinstance(question["origin"], list):
+        return {"zh": [f"zh:{o}" for o in question["origin"]]}
+    return {"zh": f"zh:{question['origin']}"}
+
+
+async def test_llm_batch() -> None:
+    t = Translator(model=util.OPENAI_MODEL, api_key=util.OPENAI_API_KEY, base_url=util.OPENAI_BASE_URL, batch_size=4)
+    t.client = util.FakeClient(_echo)  # type: ignore[assignment]
+
+    questions = [ORIGIN(origin=str(i)) for i in range(10)] + [ORIGIN(origin="")]
+    res = await t.ask_batch(questions)
+    assert [r.zh for r in res] == [f"zh:{i}" for i in range(10)] + [""]
+    assert t.client.calls == 3
+
+
+async def test_llm_batch_split() -> None:
+    def _drop_last(question: Dict[str, Any]) -> Dict[str, Any]:
+        answer = _echo(question)
+        if isinstance(answer["zh"], list) and len(answer["zh"]) > 2:
+            answer["zh"] = answer["zh"][:-1]
+        return answer
+
+    t = Translator(model=util.OPENAI_MODEL, api_key=util.OPENAI_API_KEY, base_url=util.OPENAI_BASE_URL, batch_size=8)
+    t.client = util.FakeClient(_drop_last)  # type: ignore[assignment]
+
+    questions = [ORIGIN(origin=str(i)) for i in range(8)]
+    res = await t.ask_batch(questions)
+    assert [r.zh for r in res] == [f"zh:{i}" for i in range(8)]
+
+
+async def test_llm_summarize_chunked() -> None:
+    t = Summarizer(model=util.OPENAI_MODEL, api_key=util.OPENAI_API_KEY, base_url=util.OPENAI_BASE_URL)
+    client = util.FakeClient(lambda q: {"zh": f"summary({len(q['origin'].splitlines())})"})
+    t.client = client  # type: ignore[assignment]
+
+    lines = summary_origin.origin.strip().splitlines()
+    res = await t.summarize(lines, chunk_size=10)
+
+    # 3 windows + 1 merge
+    assert client.calls == 4
+    assert res.zh == "summary(3)"
+
+
+async def test_llm_hedge() -> None:
+    hedger = Hedger(max_ratio=0.2, min_samples=5)
+    t = Translator(model=util.OPENAI_MODEL, api_key=util.OPENAI_API_KEY, base_url=util.OPENAI_BASE_URL, hedger=hedger)
+    client = util.FakeClient(_echo)
+    create = client.create
+    stuck = {"c"}
+    cancelled = []
+
+    # the first request of "c" gets stuck, its hedge answers
+    async def _stuck_once(model: str, messages: List[Dict[str, str]], **kwargs: Any) -> Any:
+        origin = json.loads(messages[-1]["content"])["origin"]
+        if origin in stuck:
+            stuck.discard(origin)
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(origin)
+                raise
+        return await create(model, messages, **kwargs)
+
+    client.chat.completions.create = _stuck_once
+    t.client = client  # type: ignore[assignment]
+
+    # warm up the latency window, no hedging before min_samples
+    for i in range(5):
+        await t.ask(ORIGIN(origin=str(i)))
+    assert hedger.fired == 0
+
+    res = await asyncio.wait_for(t.ask(ORIGIN(origin="c")), timeout=5)
+    assert res.zh == "zh:c"
+    assert (hedger.fired, hedger.wins) == (1, 1)
+    assert cancelled == ["c"]
+
+    # spend cap, 20% of 7 requests leaves no room for a second hedge
+    stuck.add("d")
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(t.ask(ORIGIN(origin="d")), timeout=0.5)
+    assert (hedger.fired, hedger.capped) == (1, 1)
+
+
 async def test_llm_none() -> None:
     t = Translator(model=util.OPENAI_MODEL, api_key=util.OPENAI_API_KEY, base_url=util.OPENAI_BASE_URL)
     print(t.system_prompt)
@@ -101,3 +190,58 @@ async def test_llm_summary() -> None:
     print(t.system_prompt)
     res = await t.ask(summary_origin)
     print(res.zh)
+
+
+def test_select_characters() -> None:
+    characters = "".join(f"モブ{i} / 路人{i}\n" for i in range(200))
+    characters = "久世 政近 / 久世政近\n九条 アリサ / 九条艾莉莎\n" + characters + "周防 有希 / 周防有希\n"
+    text = "政近くん、有希ちゃんが呼んでるよ"
+
+    # named characters survive any budget, the rest fill it in bangumi order
+    trimmed = select_characters(characters, text, budget=0)
+    assert trimmed == "久世 政近 / 久世政近\n周防 有希 / 周防有希\n"
+    trimmed = select_characters(characters, text, budget=100)
+    assert trimmed.startswith("久世 政近 / 久世政近\n九条 アリサ / 九条艾莉莎\nモブ0")
+    assert estimate_tokens(trimmed) < estimate_tokens(characters)
+    assert select_characters(characters, text, budget=None) == characters
+
+    # static prefix first, so the prompts of two episodes share it
+    prompt_a = anime_prompt(BGM(introduction="", characters=trimmed), summary="a")
+    prompt_b = anime_prompt(BGM(introduction="", characters=characters), summary="b")
+    assert prompt_a.index(trimmed) > prompt_a.index("EXAMPLE JSON OUTPUT")
+    assert prompt_a[: prompt_a.index(trimmed)] == prompt_b[: prompt_b.index(characters)]
+
+
+async def test_llm_endpoint_pool() -> None:
+    served: Dict[str, int] = {"a": 0, "b": 0, "down": 0}
+
+    def _factory(endpoint: Endpoint) -> httpx.AsyncClient:
+        name = endpoint.base_url.split("//")[1].split("/")[0]
+        stub = util.openai_stub(_echo)
+
+        def _handle(request: httpx.Request) -> httpx.Response:
+            served[name] += 1
+            if name == "down":
+                raise httpx.ConnectError("connection refused", request=request)
+            return stub(request)
+
+        return httpx.AsyncClient(transport=httpx.MockTransport(_handle))
+
+    endpoints = [Endpoint.parse(f"http://{name}/v1,key=sk-{name}") for name in ("down", "a", "b")]
+    endpoints[2].weight = 3
+    pool = EndpointPool(endpoints, failure_threshold=2, cooldown=60, http_client_factory=_factory)
+    t = Translator(model=util.OPENAI_MODEL, api_key="", base_url="", pool=pool)
+
+    res = await asyncio.gather(*[t.ask(ORIGIN(origin=str(i))) for i in range(40)])
+    assert [r.zh for r in res] == [f"zh:{i}" for i in range(40)]
+
+    # the dead endpoint fails over and is skipped once its breaker opens (requests already in flight still hit it),
+    # the weighted one takes most traffic
+    assert 2 <= served["down"] <= 3
+    assert pool.open_until[0] > 0
+    assert served["b"] > served["a"] > 0
+    assert pool.active == [0, 0, 0]
+    await pool.close()
+
+    with pytest.raises(ValueError):
+        Endpoint.parse("http://a/v1,token=x")
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+
+from yuisub.instrument import Event, Instrumentation
+from yuisub.pipeline import StageGraph
+
+
+async def _sleep(seconds: float, result: str) -> str:
+    await asyncio.sleep(seconds)
+    return result
+
+
+async def test_stage_graph() -> None:
+    events: List[Event] = []
+    graph = StageGraph(Instrumentation([events.append]))
+    graph.add("whisper", lambda: _sleep(0.2, "sub"))
+    graph.add("bangumi", lambda: _sleep(0.1, "bgm"))
+    graph.add("llm", lambda sub, bgm: _sleep(0.05, f"{sub}+{bgm}"), after=["whisper", "bangumi"])
+
+    t = time.perf_counter()
+    results = await graph.run()
+    elapsed = time.perf_counter() - t
+
+    assert results["llm"] == "sub+bgm"
+    # bangumi runs in the shadow of whisper
+    assert elapsed < 0.32
+    assert {e.name for e in events if e.kind == "stage"} == {"whisper", "bangumi", "llm"}
+
+    path = graph.critical_path()
+    assert [name for name, _ in path] == ["whisper", "llm"]
+    assert sum(seconds for _, seconds in path) == pytest.approx(elapsed, abs=0.02)
+    assert [(e.name, e.elapsed) for e in events if e.kind == "critical"] == path
+
+
+async def test_stage_graph_streams() -> None:
+    queue: asyncio.Queue[int] = asyncio.Queue()
+
+    async def _produce() -> None:
+        for i in range(3):
+            await asyncio.sleep(0.03)
+            queue.put_nowait(i)
+
+    async def _consume() -> List[int]:
+        return [await queue.get() for _ in range(3)]
+
+    graph = StageGraph()
+    graph.add("whisper", _produce)
+    graph.add("llm", _consume, streams=["whisper"])
+    assert (await graph.run())["llm"] == [0, 1, 2]
+
+    # the consumer only adds the time it ran past the end of the stream
+    path = dict(graph.critical_path())
+    assert path["whisper"] > 0.08
+    assert path["llm"] < 0.02
+
+
+async def test_stage_graph_failure() -> None:
+    cancelled = asyncio.Event()
+
+    async def _fail() -> None:
+        raise RuntimeError("bangumi is down")
+
+    async def _slow() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    graph = StageGraph()
+    graph.add("whisper", _slow)
+    graph.add("bangumi", _fail)
+    with pytest.raises(RuntimeError):
+        await graph.run()
+    assert cancelled.is_set()
+
+    with pytest.raises(ValueError):
+        graph.add("llm", _slow, after=["summary"])
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import List
+
+from yuisub import Scheduler
+
+
+async def test_scheduler_concurrency() -> None:
+    scheduler = Scheduler(max_concurrency=3)
+    peak = 0
+
+    async def _task() -> None:
+        nonlocal peak
+        async with scheduler.slot():
+            peak = max(peak, scheduler.active)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[_task() for _ in range(20)])
+    assert peak == 3
+    assert scheduler.active == 0
+    assert scheduler.waiting == 0
+
+
+async def test_scheduler_fair() -> None:
+    scheduler = Scheduler(max_concurrency=1)
+    order: List[str] = []
+
+    async def _task(key: str) -> None:
+        async with scheduler.slot(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    # episode "a" enqueues all its lines before episode "b"
+    await scheduler.acquire()
+    tasks = asyncio.gather(*[_task("a") for _ in range(4)], *[_task("b") for _ in range(4)])
+    await asyncio.sleep(0)
+    scheduler.release()
+    await tasks
+    assert order == ["a", "b"] * 4
+
+
+async def test_scheduler_rpm() -> None:
+    scheduler = Scheduler(max_concurrency=10, rpm=600)
+    scheduler.rpm.available = 0  # type: ignore[union-attr]
+
+    t = time.monotonic()
+    async with scheduler.slot():
+        pass
+    assert time.monotonic() - t >= 0.09
+
+
+async def test_scheduler_cancel() -> None:
+    scheduler = Scheduler(max_concurrency=1)
+    await scheduler.acquire()
+
+    waiter = asyncio.ensure_future(scheduler.acquire("b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert scheduler.waiting == 0
+
+    scheduler.release()
+    assert scheduler.active == 0
+
+
+def test_scheduler_new_loop() -> None:
+    scheduler = Scheduler(max_concurrency=1)
+
+    async def _acquire() -> None:
+        # the timer of this pause outlives the loop of the first run
+        scheduler.penalize(0.05)
+        await asyncio.wait_for(scheduler.acquire(), 1)
+        scheduler.release()
+
+    async def _abandon() -> None:
+        scheduler.penalize(0.2)
+        try:
+            await asyncio.wait_for(scheduler.acquire(), 0.01)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(_abandon())
+    asyncio.run(_acquire())
+    assert scheduler.active == 0
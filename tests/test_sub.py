@@ -1,9 +1,25 @@
+import asyncio
 import os
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List
 
 import pytest
+from pysubs2 import SSAEvent, SSAFile
 
 from yuisub.a2t import WhisperModel
-from yuisub.sub import bilingual, load, translate
+from yuisub.journal import Journal
+from yuisub.llm import Translator
+from yuisub.scheduler import Scheduler
+from yuisub.sub import (
+    SubtitleStream,
+    TranslationStats,
+    bilingual,
+    compose,
+    load,
+    restore_markup,
+    strip_markup,
+    translate,
+)
 
 from . import util
 
@@ -20,11 +36,333 @@ def test_audio() -> None:
     sub.save(util.projectPATH / "assets" / "test.audio.ass")
 
 
+async def test_audio_stream() -> None:
+    model = WhisperModel(name=util.MODEL_NAME, device=util.DEVICE)
+
+    sub = SSAFile()
+    async for e in model.transcribe_stream(audio=str(util.TEST_AUDIO), chunk_length=10):
+        sub.append(e)
+    sub.save(util.projectPATH / "assets" / "test.audio.stream.ass")
+
+
 async def test_bilingual() -> None:
     sub = load(util.TEST_ENG_SRT)
     await bilingual(sub, sub)
 
 
+async def test_compose() -> None:
+    sub = load(util.TEST_ENG_SRT)
+    before = [e.as_dict() for e in sub]
+    ad = SSAEvent(text="ad", style="ad")
+
+    sub_zh, sub_bilingual = compose(sub, [f"zh:{e.text}" for e in sub], ad=ad)
+
+    # the caller's events are left alone
+    assert [e.as_dict() for e in sub] == before
+    assert [e.text for e in sub_zh] == ["ad"] + [f"zh:{e.text}" for e in sub]
+    assert {e.style for e in sub_zh[1:]} == {"zh"}
+    assert [(e.start, e.end) for e in sub_zh[1:]] == [(e.start, e.end) for e in sub]
+    assert [e.text for e in sub_bilingual[: len(sub)]] == [e.text for e in sub]
+    assert {e.style for e in sub_bilingual[: len(sub)]} == {"origin"}
+    assert sub_bilingual[len(sub) :] == sub_zh.events
+
+    # same output as the two step api
+    sub_bilingual_2 = await bilingual(sub, sub_zh)
+    assert [e.as_dict() for e in sub_bilingual_2] == [e.as_dict() for e in sub_bilingual]
+    assert [e.as_dict() for e in sub] == before
+
+
+def _echo(question: Dict[str, Any]) -> Dict[str, Any]:
+    if isinstance(question["origin"], list):
+        return {"zh": [f"zh:{o}" for o in question["origin"]]}
+    return {"zh": f"zh:{question['origin']}"}
+
+
+def _expected(text: str) -> str:
+    markup = strip_markup(text)
+    return restore_markup(markup, f"zh:{markup.text}")
+
+
+async def test_translate_dedup(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = load(util.TEST_ENG_SRT)
+    stats = TranslationStats()
+    sub_zh = await translate(
+        sub=sub,
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        ad=None,
+        stats=stats,
+    )
+
+    assert [e.text for e in sub_zh] == [_expected(e.text) for e in sub]
+    assert stats.lines == len(sub)
+    assert stats.dedup_saved == len(sub) - len({strip_markup(e.text).text for e in sub})
+    # one summary request + one request per unique line
+    assert client.calls == 1 + stats.unique_lines
+
+
+async def test_translate_bilingual(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = load(util.TEST_ENG_SRT)
+    before = [e.as_dict() for e in sub]
+    sub_bilingual = SSAFile()
+    sub_zh = await translate(
+        sub=sub,
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        sub_bilingual=sub_bilingual,
+    )
+
+    assert [e.as_dict() for e in sub] == before
+    assert len(sub_bilingual) == len(sub) + len(sub_zh)
+    assert sub_bilingual[len(sub) :] == sub_zh.events
+
+
+class _ShuffledClient(util.FakeClient):
+    # answers finish out of order
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> Any:
+        await asyncio.sleep(hash(messages[-1]["content"]) % 10 / 1000)
+        return await super().create(model, messages, **kwargs)
+
+
+async def test_translate_stream_output(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    client = _ShuffledClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = load(util.TEST_ENG_SRT)
+    sub_zh = await translate(
+        sub=sub, model=util.OPENAI_MODEL, api_key=util.OPENAI_API_KEY, base_url=util.OPENAI_BASE_URL, batch_size=3
+    )
+
+    with SubtitleStream(zh_path=tmp_path / "zh.ass", bilingual_path=tmp_path / "bilingual.ass") as output:
+        streamed = await translate(
+            sub=sub,
+            model=util.OPENAI_MODEL,
+            api_key=util.OPENAI_API_KEY,
+            base_url=util.OPENAI_BASE_URL,
+            batch_size=3,
+            output=output,
+        )
+
+    assert len(streamed) == 0
+    sub_zh.save(tmp_path / "saved.ass")
+    assert (tmp_path / "zh.ass").read_text() == (tmp_path / "saved.ass").read_text()
+    assert len(load(tmp_path / "bilingual.ass")) == 2 * len(sub) + 1
+
+
+def test_markup() -> None:
+    m = strip_markup(r"{\i1}Hello\Nworld{\i0}")
+    assert (m.prefix, m.text, m.suffix) == (r"{\i1}", "Hello world", r"{\i0}")
+    assert restore_markup(m, "你好") == r"{\i1}你好{\i0}"
+
+    # line-wide tags survive, inline ones are dropped
+    m = strip_markup(r"Hi {\c&H0000FF&}there{\pos(10,20)}!")
+    assert (m.prefix, m.text) == (r"{\pos(10,20)}", "Hi there!")
+
+    assert strip_markup(r"{\p1}m 0 0 l 100 0 100 100{\p0}").drawing
+    assert strip_markup(r"{\an8}").text == ""
+
+
+async def test_translate_markup(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent = []
+
+    def _handler(question: Dict[str, Any]) -> Dict[str, Any]:
+        sent.append(question["origin"])
+        return _echo(question)
+
+    client = util.FakeClient(_handler)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = SSAFile()
+    sub.append(SSAEvent(start=0, end=1000, text=r"{\an8\i1}Good\Nmorning{\i0}"))
+    sub.append(SSAEvent(start=1000, end=2000, text=r"{\p1}m 0 0 l 100 0 100 100{\p0}"))
+    stats = TranslationStats()
+    sub_zh = await translate(
+        sub=sub,
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        ad=None,
+        stats=stats,
+    )
+
+    assert [e.text for e in sub_zh] == [r"{\an8\i1}zh:Good morning{\i0}", sub[1].text]
+    assert stats.drawings_skipped == 1
+    assert not any("\\" in s for s in sent)
+
+
+async def test_translate_journal(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = load(util.TEST_ENG_SRT)
+    texts = list(dict.fromkeys(strip_markup(e.text).text for e in sub))
+    journal_path = tmp_path / "ep01.journal.jsonl"
+
+    # first attempt: one line fails past its retries and degrades to the origin text
+    ask_batch = Translator.ask_batch
+
+    async def _ask_batch(self: Translator, questions: List[Any]) -> List[Any]:
+        if questions[0].origin == sub[2].text:
+            raise RuntimeError("boom")
+        return await ask_batch(self, questions)
+
+    monkeypatch.setattr(Translator, "ask_batch", _ask_batch)
+    stats = TranslationStats()
+    kwargs: Dict[str, Any] = {
+        "model": util.OPENAI_MODEL,
+        "api_key": util.OPENAI_API_KEY,
+        "base_url": util.OPENAI_BASE_URL,
+        "ad": None,
+        "journal_path": journal_path,
+    }
+    sub_zh = await translate(sub=sub, stats=stats, **kwargs)
+
+    assert sub_zh[2].text == sub[2].text
+    assert stats.failed_lines == 1
+    assert len(Journal(journal_path, util.OPENAI_MODEL)) == len(texts)  # summary + every other line
+
+    # re-run: only the failed line is sent, the journal is removed once complete
+    monkeypatch.setattr(Translator, "ask_batch", ask_batch)
+    calls = client.calls
+    stats = TranslationStats()
+    sub_zh = await translate(sub=sub, stats=stats, **kwargs)
+
+    assert [e.text for e in sub_zh] == [_expected(e.text) for e in sub]
+    assert client.calls == calls + 1
+    assert stats.resumed_lines == len(texts) - 1
+    assert not journal_path.exists()
+
+
+async def test_translate_journal_fallback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    sub = load(util.TEST_ENG_SRT)
+    broken = strip_markup(sub[2].text).text
+
+    # an unparsable answer degrades the line to its origin text, it must not be journaled as translated
+    def _handler(question: Dict[str, Any]) -> Dict[str, Any]:
+        return {"oops": ""} if question["origin"] == broken else _echo(question)
+
+    client = util.FakeClient(_handler)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    journal_path = tmp_path / "ep01.journal.jsonl"
+    kwargs: Dict[str, Any] = {
+        "model": util.OPENAI_MODEL,
+        "api_key": util.OPENAI_API_KEY,
+        "base_url": util.OPENAI_BASE_URL,
+        "ad": None,
+        "journal_path": journal_path,
+    }
+    stats = TranslationStats()
+    sub_zh = await translate(sub=sub, stats=stats, **kwargs)
+
+    assert sub_zh[2].text == sub[2].text
+    assert stats.failed_lines == 1
+    assert Journal(journal_path, util.OPENAI_MODEL).get("line", broken) is None
+
+    # re-run: the fallback line is sent again
+    client.handler = _echo
+    sub_zh = await translate(sub=sub, **kwargs)
+    assert sub_zh[2].text == _expected(sub[2].text)
+    assert not journal_path.exists()
+
+
+async def test_translate_context(monkeypatch: pytest.MonkeyPatch) -> None:
+    sent: List[Dict[str, Any]] = []
+
+    def _handler(question: Dict[str, Any]) -> Dict[str, Any]:
+        sent.append(question)
+        return _echo(question)
+
+    client = util.FakeClient(_handler)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = SSAFile()
+    for i, text in enumerate(["I think you", "mentioned it", "in your introduction.", "Anyway."]):
+        sub.append(SSAEvent(start=i * 1000, end=(i + 1) * 1000, text=text))
+
+    kwargs: Dict[str, Any] = {
+        "model": util.OPENAI_MODEL,
+        "api_key": util.OPENAI_API_KEY,
+        "base_url": util.OPENAI_BASE_URL,
+        "ad": None,
+        "context_size": 2,
+    }
+    sub_zh = await translate(sub=sub, **kwargs)
+    assert [e.text for e in sub_zh] == [f"zh:{e.text}" for e in sub]
+
+    line = next(q for q in sent if q["origin"] == "mentioned it")
+    assert line["context_before"] == ["I think you"]
+    assert line["context_after"] == ["in your introduction.", "Anyway."]
+
+    # with batching only the batch edges carry context, the request count stays the same
+    sent.clear()
+    await translate(sub=sub, batch_size=2, **kwargs)
+    batches = [q for q in sent if isinstance(q["origin"], list)]
+    assert len(batches) == 2
+    assert "context_before" not in batches[0]
+    assert batches[0]["context_after"] == ["in your introduction.", "Anyway."]
+    assert batches[1]["context_before"] == ["I think you", "mentioned it"]
+
+    # the second batch waits for its slot behind the first one and gets its translations along
+    sent.clear()
+    await translate(sub=sub, batch_size=2, scheduler=Scheduler(max_concurrency=1), **kwargs)
+    batches = [q for q in sent if isinstance(q["origin"], list)]
+    assert batches[1]["context_before_zh"] == ["zh:I think you", "zh:mentioned it"]
+
+
+async def test_translate_partial_summary(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = load(util.TEST_ENG_SRT)
+    stats = TranslationStats()
+    sub_zh = await translate(
+        sub=sub,
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        ad=None,
+        stats=stats,
+        summary_chunk_size=5,
+        partial_summary=True,
+    )
+
+    assert [e.text for e in sub_zh] == [_expected(e.text) for e in sub]
+    # one summary per window + one request per unique line, no merge
+    assert client.calls == 3 + stats.unique_lines
+
+
+async def test_translate_stream(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(_echo)
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    sub = load(util.TEST_ENG_SRT)
+
+    async def _stream() -> AsyncIterator[SSAEvent]:
+        for e in sub:
+            await asyncio.sleep(0)
+            yield e
+
+    sub_zh = await translate(
+        sub=_stream(),
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        ad=None,
+        summary_chunk_size=4,
+    )
+
+    assert [e.text for e in sub_zh] == [_expected(e.text) for e in sub]
+
+
 @pytest.mark.skipif(os.environ.get("GITHUB_ACTIONS") == "true", reason="Skipping test when running on CI")
 async def test_bilingual_2() -> None:
     sub = load(util.TEST_ENG_SRT)
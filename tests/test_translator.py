@@ -1,7 +1,13 @@
+import asyncio
 import os
+from typing import Any, AsyncIterator, Dict, List
 
+import pysubs2
 import pytest
 
+from yuisub.bangumi import BGM
+from yuisub.instrument import Event, Instrumentation
+from yuisub.sub import TranslationStats, load
 from yuisub.translator import SubtitleTranslator
 
 from . import util
@@ -55,3 +61,146 @@ async def test_translator_audio() -> None:
     sub_zh, sub_bilingual = await translator.get_subtitles(audio=str(util.TEST_AUDIO))
     sub_zh.save(util.projectPATH / "assets" / "test.zh.translator.audio.ass")
     sub_bilingual.save(util.projectPATH / "assets" / "test.bilingual.translator.audio.ass")
+
+
+async def test_translator_shared_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    created: List[util.FakeClient] = []
+
+    def _client(**kwargs: Any) -> util.FakeClient:
+        created.append(util.FakeClient(lambda q: {"zh": f"zh:{q['origin']}"}))
+        return created[-1]
+
+    util.patch_llm_client(monkeypatch, _client)
+
+    async with SubtitleTranslator(
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+    ) as translator:
+        for _ in range(2):
+            sub_zh, _ = await translator.get_subtitles(sub=str(util.TEST_ENG_SRT))
+            assert sub_zh[1].text.startswith("zh:")
+
+        # one pooled client for both episodes, summarizer and translators included
+        assert len(created) == 1
+        assert created[0].calls > 0
+
+    assert translator.llm_client is None
+
+
+class _LoopClient(util.FakeClient):
+    """
+    FakeClient that, like a pooled http client, only works in the event loop it was created in and until closed
+    """
+
+    def __init__(self) -> None:
+        super().__init__(lambda q: {"zh": f"zh:{q['origin']}"})
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> Any:
+        if self.closed or asyncio.get_running_loop() is not self.loop:
+            raise RuntimeError("Event loop is closed")
+        return await super().create(model, messages, **kwargs)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_translator_per_call_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    created: List[_LoopClient] = []
+
+    def _client(**kwargs: Any) -> _LoopClient:
+        created.append(_LoopClient())
+        return created[-1]
+
+    util.patch_llm_client(monkeypatch, _client)
+
+    translator = SubtitleTranslator(
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+    )
+
+    # outside `async with` every call gets its own clients, a second asyncio.run can't reuse the first one's
+    for _ in range(2):
+        sub_zh, _ = asyncio.run(translator.get_subtitles(sub=str(util.TEST_ENG_SRT)))
+        assert sub_zh[1].text.startswith("zh:")
+
+    assert len(created) == 2
+    assert all(client.closed for client in created)
+    assert translator.llm_client is None
+
+
+async def test_translator_instrument(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = util.FakeClient(lambda q: {"zh": f"zh:{q['origin']}"})
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    events: List[Event] = []
+    stats = TranslationStats()
+
+    async with SubtitleTranslator(
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        cache_path=":memory:",
+        instrument=Instrumentation([events.append]),
+    ) as translator:
+        await translator.get_subtitles(sub=str(util.TEST_ENG_SRT), stats=stats)
+
+    assert stats.requests == client.calls
+    assert stats.prompt_tokens == 10 * client.calls
+    assert stats.completion_tokens == 5 * client.calls
+    assert len(stats.request_latency) == client.calls
+    assert stats.cache_misses > 0
+    assert {"summary", "translate", "llm", "compose"} <= set(stats.stages)
+    # the translator-level callback sees the same events as the per-episode stats
+    assert sum(e.kind == "request" for e in events) == stats.requests
+
+
+class _SlowWhisper:
+    """
+    WhisperModel stand-in taking `delay` seconds to transcribe the test subtitle
+    """
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    async def atranscribe(self, audio: Any, executor: Any = None) -> pysubs2.SSAFile:
+        await asyncio.sleep(self.delay)
+        return load(util.TEST_ENG_SRT)
+
+    async def transcribe_stream(self, audio: Any) -> AsyncIterator[pysubs2.SSAEvent]:
+        for e in load(util.TEST_ENG_SRT):
+            await asyncio.sleep(self.delay / 10)
+            yield e
+
+
+@pytest.mark.parametrize("stream_audio", [False, True])
+async def test_translator_overlap(monkeypatch: pytest.MonkeyPatch, stream_audio: bool) -> None:
+    client = util.FakeClient(lambda q: {"zh": f"zh:{q['origin']}"})
+    util.patch_llm_client(monkeypatch, lambda **kwargs: client)
+
+    async def _bangumi(*args: Any) -> BGM:
+        await asyncio.sleep(0.1)
+        return BGM(introduction="", characters="")
+
+    monkeypatch.setattr("yuisub.translator.bangumi", _bangumi)
+
+    stats = TranslationStats()
+    async with SubtitleTranslator(
+        model=util.OPENAI_MODEL,
+        api_key=util.OPENAI_API_KEY,
+        base_url=util.OPENAI_BASE_URL,
+        bangumi_url=util.BANGUMI_URL,
+        stream_audio=stream_audio,
+    ) as translator:
+        translator.whisper_model_instance = _SlowWhisper(0.2)  # type: ignore[assignment]
+        sub_zh, _ = await translator.get_subtitles(audio="episode.mp3", stats=stats)
+
+    assert sub_zh[1].text.startswith("zh:")
+    # bangumi is fetched while whisper runs, so it's not on the critical path
+    assert stats.stages["bangumi"] >= 0.1
+    assert "bangumi" not in stats.critical_path
+    assert {"whisper", "llm"} <= set(stats.critical_path)
+    assert sum(stats.critical_path.values()) < stats.stages["whisper"] + stats.stages["bangumi"]
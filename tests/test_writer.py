@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+from pysubs2 import SSAEvent
+
+from yuisub.sub import PRESET_STYLES, SubtitleStream, advertisement, compose, load
+from yuisub.writer import SubtitleWriter
+
+from . import util
+
+
+@pytest.mark.parametrize("suffix", [".ass", ".ssa", ".srt"])
+def test_writer(tmp_path: Path, suffix: str) -> None:
+    sub = load(util.TEST_ENG_SRT)
+    sub.styles = PRESET_STYLES
+    sub.save(tmp_path / f"saved{suffix}")
+
+    with SubtitleWriter(tmp_path / f"streamed{suffix}", PRESET_STYLES) as writer:
+        for i in range(0, len(sub), 3):
+            writer.write(sub[i : i + 3])
+
+    assert (tmp_path / f"streamed{suffix}").read_text() == (tmp_path / f"saved{suffix}").read_text()
+
+
+def test_writer_format(tmp_path: Path) -> None:
+    with pytest.raises(ValueError):
+        SubtitleWriter(tmp_path / "out.vtt")
+
+
+def test_stream_reorder(tmp_path: Path) -> None:
+    events = [SSAEvent(start=i * 1000, end=i * 1000 + 900, text=f"line {i}") for i in range(5)]
+    zh_path, bilingual_path = tmp_path / "zh.srt", tmp_path / "bilingual.ass"
+
+    with SubtitleStream(zh_path=zh_path, bilingual_path=bilingual_path, ad=None) as stream:
+        for i in (2, 1, 4):
+            stream.put(i, events[i], f"zh {i}")
+        assert (stream.written, stream.pending) == (0, 3)
+
+        stream.put(0, events[0], "zh 0")
+        assert (stream.written, stream.pending) == (3, 1)
+        # written events are readable before the episode is done
+        assert load(zh_path).events[-1].text == "zh 2"
+
+        # a retried episode hands over the same events again
+        stream.put(1, events[1], "zh 1")
+        stream.put(3, events[3], "zh 3")
+        assert (stream.written, stream.pending) == (5, 0)
+
+    assert [e.text for e in load(zh_path)] == [f"zh {i}" for i in range(5)]
+    bilingual = load(bilingual_path)
+    assert [e.style for e in bilingual] == ["origin", "zh"] * 5
+    assert [e.text for e in bilingual][:2] == ["line 0", "zh 0"]
+    assert [e.text for e in events] == [f"line {i}" for i in range(5)]
+
+
+def test_stream_bilingual_layout(tmp_path: Path) -> None:
+    events = [SSAEvent(start=i * 1000, end=i * 1000 + 900, text=f"line {i}") for i in range(3)]
+    texts = [f"zh {i}" for i in range(3)]
+    ad = advertisement()
+
+    with SubtitleStream(bilingual_path=tmp_path / "bilingual.ass", ad=ad) as stream:
+        for i, e in enumerate(events):
+            stream.put(i, e, texts[i])
+
+    # streamed: ad, then each origin line followed by its translation
+    streamed = [(e.style, e.text) for e in load(tmp_path / "bilingual.ass")]
+    assert streamed[1:] == [
+        (style, text) for i in range(3) for style, text in (("origin", f"line {i}"), ("zh", f"zh {i}"))
+    ]
+
+    # compose: every origin line, then the ad and the translations, the same events in another order
+    _, sub_bilingual = compose(events, texts, ad=ad)
+    composed = [(e.style, e.text) for e in sub_bilingual]
+    assert composed[:3] == [("origin", f"line {i}") for i in range(3)]
+    assert sorted(streamed) == sorted(composed)
@@ -1,5 +1,11 @@
+import json
 import os
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import httpx
+import pytest
 
 projectPATH = Path(__file__).resolve().parent.parent.absolute()
 
@@ -15,3 +21,66 @@ BANGUMI_ACCESS_TOKEN = ""
 OPENAI_MODEL = str(os.getenv("OPENAI_MODEL")) if os.getenv("OPENAI_MODEL") else "deepseek-chat"
 OPENAI_BASE_URL = str(os.getenv("OPENAI_BASE_URL")) if os.getenv("OPENAI_BASE_URL") else "https://api.deepseek.com"
 OPENAI_API_KEY = str(os.getenv("OPENAI_API_KEY")) if os.getenv("OPENAI_API_KEY") else "sk-"
+
+
+class FakeClient:
+    """
+    Offline stand-in for AsyncOpenAI, answers chat completions with handler(json.loads(user_content))
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Dict[str, Any]]) -> None:
+        self.handler = handler
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> Any:
+        self.calls += 1
+        content = self.handler(json.loads(messages[-1]["content"]))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+def patch_llm_client(monkeypatch: pytest.MonkeyPatch, factory: Callable[..., Any]) -> None:
+    """
+    Build every llm client of yuisub with factory(**create_llm_client kwargs), e.g. to return a FakeClient
+    """
+
+    def _create(api_key: str, base_url: str, **kwargs: Any) -> Any:
+        return factory(api_key=api_key, base_url=base_url, **kwargs)
+
+    for module in ("yuisub.llm", "yuisub.sub", "yuisub.translator"):
+        monkeypatch.setattr(f"{module}.create_llm_client", _create)
+
+
+def openai_stub(handler: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable[[httpx.Request], httpx.Response]:
+    """
+    httpx.MockTransport handler of a stub OpenAI compatible server, answers chat completions with handler
+    """
+
+    def _handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        content = handler(json.loads(body["messages"][-1]["content"]))
+        return httpx.Response(
+            200,
+            json={
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": json.dumps(content)},
+                    }
+                ],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            },
+        )
+
+    return _handle
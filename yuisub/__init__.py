@@ -1,5 +1,73 @@
-from yuisub.bangumi import BGM, bangumi  # noqa: F401
-from yuisub.llm import Summarizer, Translator  # noqa: F401
-from yuisub.prompt import ORIGIN, ZH  # noqa: F401
-from yuisub.sub import advertisement, bilingual, load, translate  # noqa: F401
-from yuisub.translator import SubtitleTranslator  # noqa: F401
+import importlib
+import logging
+import sys
+import types
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from yuisub.bangumi import BGM, BangumiCache, bangumi  # noqa: F401
+    from yuisub.cache import TranslationCache  # noqa: F401
+    from yuisub.instrument import Event, Instrumentation  # noqa: F401
+    from yuisub.llm import Endpoint, EndpointPool, Summarizer, Translator  # noqa: F401
+    from yuisub.prompt import ORIGIN, ORIGIN_BATCH, ZH, ZH_BATCH  # noqa: F401
+    from yuisub.scheduler import Hedger, Scheduler  # noqa: F401
+    from yuisub.sub import SubtitleStream, TranslationStats, advertisement, bilingual, compose, load, translate  # noqa: F401
+    from yuisub.translator import SubtitleTranslator  # noqa: F401
+
+# public names and their modules, imported on first access so `import yuisub` and `yuisub -h` stay fast
+_LAZY: Dict[str, str] = {
+    "BGM": "yuisub.bangumi",
+    "BangumiCache": "yuisub.bangumi",
+    "bangumi": "yuisub.bangumi",
+    "TranslationCache": "yuisub.cache",
+    "Event": "yuisub.instrument",
+    "Instrumentation": "yuisub.instrument",
+    "Endpoint": "yuisub.llm",
+    "EndpointPool": "yuisub.llm",
+    "Summarizer": "yuisub.llm",
+    "Translator": "yuisub.llm",
+    "ORIGIN": "yuisub.prompt",
+    "ORIGIN_BATCH": "yuisub.prompt",
+    "ZH": "yuisub.prompt",
+    "ZH_BATCH": "yuisub.prompt",
+    "Hedger": "yuisub.scheduler",
+    "Scheduler": "yuisub.scheduler",
+    "SubtitleStream": "yuisub.sub",
+    "TranslationStats": "yuisub.sub",
+    "advertisement": "yuisub.sub",
+    "bilingual": "yuisub.sub",
+    "compose": "yuisub.sub",
+    "load": "yuisub.sub",
+    "translate": "yuisub.sub",
+    "SubtitleTranslator": "yuisub.translator",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    # later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name: str, value: Any) -> None:
+        # importing yuisub.bangumi binds the submodule to the package, yuisub.bangumi stays the function
+        if name in _LAZY and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
+
+# library logging is silent unless the application configures it, the CLI does
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -1,40 +1,143 @@
 import argparse
-import asyncio
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from yuisub import SubtitleTranslator
+if TYPE_CHECKING:
+    from yuisub import SubtitleTranslator
 
 parser = argparse.ArgumentParser(description="Generate Bilingual Subtitle from audio or subtitle file")
 
 # Input
-parser.add_argument("-a", "--AUDIO", type=str, help="Path to the audio file", required=False)
-parser.add_argument("-s", "--SUB", type=str, help="Path to the input Subtitle file", required=False)
+parser.add_argument(
+    "-a", "--AUDIO", type=str, help="Path to the audio file, or a directory/glob for batch mode", required=False
+)
+parser.add_argument(
+    "-s", "--SUB", type=str, help="Path to the input Subtitle file, or a directory/glob for batch mode", required=False
+)
 # Output
 parser.add_argument("-oz", "--OUTPUT_ZH", type=str, help="Path to save the Chinese ASS file", required=False)
 parser.add_argument("-ob", "--OUTPUT_BILINGUAL", type=str, help="Path to save the bilingual ASS file", required=False)
+parser.add_argument(
+    "-od", "--OUTPUT_DIR", type=str, help="Directory to save the ASS files in batch mode", required=False
+)
+parser.add_argument(
+    "-so",
+    "--STREAM_OUTPUT",
+    action="store_true",
+    help="Write the ASS files while translating, in event order, the bilingual file interleaves each line "
+    "with its translation instead of listing all origin lines first",
+)
+parser.add_argument("-j", "--JOBS", type=int, default=2, help="Episodes translated concurrently in batch mode")
+parser.add_argument(
+    "-mf", "--MANIFEST", type=str, help="Path to the batch manifest, default is OUTPUT_DIR/yuisub-manifest.json"
+)
 # OpenAI GPT
 parser.add_argument("-om", "--OPENAI_MODEL", type=str, help="Openai model name", required=True)
 parser.add_argument("-api", "--OPENAI_API_KEY", type=str, help="Openai API key", required=True)
 parser.add_argument("-url", "--OPENAI_BASE_URL", type=str, help="Openai base URL", required=True)
+parser.add_argument(
+    "-ep",
+    "--ENDPOINT",
+    type=str,
+    action="append",
+    help="Extra OpenAI compatible endpoint to balance requests over, 'base_url,key=api_key,model=name,weight=1', "
+    "can be repeated",
+    required=False,
+)
+parser.add_argument(
+    "-bs", "--BATCH_SIZE", type=int, default=1, help="Number of lines translated per request", required=False
+)
+parser.add_argument("-mc", "--MAX_CONCURRENCY", type=int, default=16, help="Max in-flight LLM requests", required=False)
+parser.add_argument("-rpm", "--RPM", type=int, help="LLM requests per minute limit", required=False)
+parser.add_argument("-tpm", "--TPM", type=int, help="LLM tokens per minute limit", required=False)
+parser.add_argument("-cache", "--CACHE_PATH", type=str, help="Path to the translation cache database", required=False)
+parser.add_argument(
+    "-sc", "--SUMMARY_CHUNK_SIZE", type=int, help="Summarize windows of this many lines in parallel", required=False
+)
+parser.add_argument(
+    "-ps",
+    "--PARTIAL_SUMMARY",
+    action="store_true",
+    help="Translate each window with its own summary instead of waiting for the whole episode",
+)
+parser.add_argument("-h2", "--HTTP2", action="store_true", help="Use HTTP/2 for LLM and Bangumi requests")
+parser.add_argument(
+    "-hg", "--HEDGE", action="store_true", help="Duplicate LLM requests slower than the p95 latency, first one wins"
+)
+parser.add_argument(
+    "-cs",
+    "--CONTEXT_SIZE",
+    type=int,
+    default=0,
+    help="Number of neighbor lines sent as context with each request",
+    required=False,
+)
 # Bangumi
 parser.add_argument("-bgm", "--BANGUMI_URL", type=str, help="Anime Bangumi URL", required=False)
 parser.add_argument("-ac", "--BANGUMI_ACCESS_TOKEN", type=str, help="Anime Bangumi Access Token", required=False)
+parser.add_argument("-bc", "--BANGUMI_CACHE_DIR", type=str, help="Directory to cache Bangumi data", required=False)
+parser.add_argument("-bo", "--BANGUMI_OFFLINE", action="store_true", help="Use only cached Bangumi data")
 # Whisper
 parser.add_argument("-d", "--TORCH_DEVICE", type=str, help="Pytorch device to use", required=False)
 parser.add_argument("-wm", "--WHISPER_MODEL", type=str, help="Whisper model to use", required=False)
+parser.add_argument(
+    "-tw",
+    "--TRANSCRIBE_WORKERS",
+    type=int,
+    default=0,
+    help="Worker processes transcribing episodes in parallel, each with its own model, 0 to use a thread",
+)
+parser.add_argument("-pc", "--PCM_CACHE_DIR", type=str, help="Directory to cache decoded audio in", required=False)
+parser.add_argument(
+    "-vad",
+    "--VAD",
+    action="store_true",
+    help="Split audio at silences and transcribe the chunks in parallel, on the -tw worker processes",
+)
+parser.add_argument(
+    "-sa",
+    "--STREAM_AUDIO",
+    action="store_true",
+    help="Translate transcribed segments while the rest of the audio is still being transcribed",
+)
+# Logging
+parser.add_argument(
+    "-ll", "--LOG_LEVEL", type=str, default="INFO", help="Log level, e.g. DEBUG, INFO, WARNING", required=False
+)
 
 args = parser.parse_args()
 
+logger = logging.getLogger("yuisub")
+
 
 async def _main() -> None:
+    # imported after argument parsing, `yuisub -h` and usage errors don't load openai and pysubs2
+    from yuisub import Endpoint, SubtitleTranslator
+    from yuisub.batch import is_batch_input
+
+    logging.basicConfig(level=args.LOG_LEVEL.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
     if args.AUDIO and args.SUB:
         raise ValueError("Please provide only one input file, either audio or subtitle file")
 
     if not args.AUDIO and not args.SUB:
         raise ValueError("Please provide an input file, either audio or subtitle file")
 
-    if not args.OUTPUT_ZH and not args.OUTPUT_BILINGUAL:
+    batch = is_batch_input(args.AUDIO or args.SUB)
+
+    if batch and not args.OUTPUT_DIR:
+        raise ValueError("Please provide an output directory for batch mode.")
+
+    if not batch and not args.OUTPUT_ZH and not args.OUTPUT_BILINGUAL:
         raise ValueError("Please provide output paths for the subtitles.")
 
+    # the main endpoint joins the pool of extra ones
+    endpoints = None
+    if args.ENDPOINT:
+        endpoints = [Endpoint(base_url=args.OPENAI_BASE_URL, api_key=args.OPENAI_API_KEY)]
+        endpoints += [Endpoint.parse(spec) for spec in args.ENDPOINT]
+
     translator = SubtitleTranslator(
         model=args.OPENAI_MODEL,
         api_key=args.OPENAI_API_KEY,
@@ -43,19 +146,81 @@ async def _main() -> None:
         bangumi_access_token=args.BANGUMI_ACCESS_TOKEN,
         torch_device=args.TORCH_DEVICE,
         whisper_model=args.WHISPER_MODEL,
+        batch_size=args.BATCH_SIZE,
+        max_concurrency=args.MAX_CONCURRENCY,
+        rpm=args.RPM,
+        tpm=args.TPM,
+        cache_path=args.CACHE_PATH,
+        summary_chunk_size=args.SUMMARY_CHUNK_SIZE,
+        partial_summary=args.PARTIAL_SUMMARY,
+        stream_audio=args.STREAM_AUDIO,
+        bangumi_cache_dir=args.BANGUMI_CACHE_DIR,
+        bangumi_offline=args.BANGUMI_OFFLINE,
+        http2=args.HTTP2,
+        context_size=args.CONTEXT_SIZE,
+        hedge=args.HEDGE,
+        endpoints=endpoints,
+        transcribe_workers=args.TRANSCRIBE_WORKERS,
+        vad=args.VAD,
+        audio_cache_dir=args.PCM_CACHE_DIR,
     )
 
-    sub_zh, sub_bilingual = await translator.get_subtitles(
-        sub=args.SUB,
-        audio=args.AUDIO,
-    )
-    if args.OUTPUT_ZH:
-        sub_zh.save(args.OUTPUT_ZH)
-    if args.OUTPUT_BILINGUAL:
-        sub_bilingual.save(args.OUTPUT_BILINGUAL)
+    async with translator:
+        await _run(translator, batch)
+
+
+async def _run(translator: "SubtitleTranslator", batch: bool) -> None:
+    from yuisub import SubtitleStream, TranslationStats
+    from yuisub.batch import AUDIO_SUFFIXES, SUB_SUFFIXES, expand_inputs, translate_batch
+
+    if batch:
+        inputs = expand_inputs(args.AUDIO or args.SUB, AUDIO_SUFFIXES if args.AUDIO else SUB_SUFFIXES)
+        manifest = await translate_batch(
+            translator=translator,
+            inputs=inputs,
+            output_dir=args.OUTPUT_DIR,
+            audio=bool(args.AUDIO),
+            jobs=args.JOBS,
+            manifest_path=args.MANIFEST,
+            stream_output=args.STREAM_OUTPUT,
+        )
+        failed = [e.input for e in manifest.episodes.values() if e.status == "failed"]
+        if failed:
+            raise RuntimeError(f"{len(failed)} episodes failed, re-run to resume: {failed}")
+        return
+
+    # sidecar checkpoint next to the output, an interrupted run resumes from it
+    output = Path(args.OUTPUT_ZH or args.OUTPUT_BILINGUAL)
+    journal_path = output.with_name(output.stem + ".journal.jsonl")
+    stats = TranslationStats()
+
+    if args.STREAM_OUTPUT:
+        with SubtitleStream(zh_path=args.OUTPUT_ZH, bilingual_path=args.OUTPUT_BILINGUAL) as stream:
+            await translator.get_subtitles(
+                sub=args.SUB, audio=args.AUDIO, stats=stats, journal_path=journal_path, output=stream
+            )
+    else:
+        sub_zh, sub_bilingual = await translator.get_subtitles(
+            sub=args.SUB,
+            audio=args.AUDIO,
+            stats=stats,
+            journal_path=journal_path,
+        )
+        if args.OUTPUT_ZH:
+            sub_zh.save(args.OUTPUT_ZH)
+        if args.OUTPUT_BILINGUAL:
+            sub_bilingual.save(args.OUTPUT_BILINGUAL)
+
+    logger.info("Stats: %s", stats.model_dump_json(exclude={"request_latency"}))
+    # saved with the origin text of the failed lines like a failed batch episode, the next run resumes from the journal
+    if stats.failed_lines:
+        raise RuntimeError(f"{stats.failed_lines} lines failed to translate, re-run to resume from {journal_path}")
 
 
 def main() -> None:
+    # not at the top, asyncio alone doubles the time of `yuisub -h`
+    import asyncio
+
     asyncio.run(_main())
 
 
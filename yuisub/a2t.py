@@ -1,10 +1,371 @@
-from typing import Optional, Tuple, Union
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import pysubs2
 import torch
 import whisper
-from pysubs2 import SSAFile
+from pysubs2 import SSAEvent, SSAFile
+from whisper.audio import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# longest chunk of speech transcribed as one job in chunked mode, seconds
+VAD_CHUNK_LENGTH = 60.0
+
+# dB between the quiet and the loud frames of audio that has silences to cut at
+VAD_MIN_DYNAMIC_RANGE = 6.0
+
+DEFAULT_AUDIO_CACHE_DIR = Path.home() / ".cache" / "yuisub" / "audio"
+
+# (name, device, in_memory)
+ModelKey = Tuple[str, str, bool]
+
+
+class _Entry:
+    def __init__(self, download_root: Optional[str]) -> None:
+        self.download_root = download_root
+        self.model: Optional[whisper.Whisper] = None
+        self.refs = 0
+        self.timer: Optional[threading.Timer] = None
+        self.load_lock = threading.Lock()
+        # concurrent transcriptions queue here, one decode at a time per model
+        self.decode_lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self, idle_timeout: Optional[float] = 300.0) -> None:
+        """
+        Process-wide pool of whisper models keyed by (name, device, in_memory), every WhisperModel with the same key
+        shares one copy of the weights. Models are loaded on first use and unloaded once no WhisperModel has
+        referenced them for idle_timeout seconds.
+
+        :param idle_timeout: seconds an unreferenced model stays loaded, 0 to unload at once, None to never unload
+        """
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._entries: Dict[ModelKey, _Entry] = {}
+
+    def acquire(self, key: ModelKey, download_root: Optional[str] = None) -> _Entry:
+        """
+        Take a reference to a model, doesn't load it
+
+        :param key: (name, device, in_memory)
+        :param download_root: whisper download root, used by the first reference
+        :return: registry entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(download_root)
+            if entry.timer is not None:
+                entry.timer.cancel()
+                entry.timer = None
+            entry.refs += 1
+            return entry
+
+    def release(self, key: ModelKey) -> None:
+        """
+        Drop a reference to a model, the last one starts the idle timer
+
+        :param key: (name, device, in_memory)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs = max(0, entry.refs - 1)
+            if entry.refs or self.idle_timeout is None:
+                return
+            if self.idle_timeout > 0:
+                entry.timer = threading.Timer(self.idle_timeout, self.evict, args=(key,))
+                entry.timer.daemon = True
+                entry.timer.start()
+                return
+
+        self.evict(key)
+
+    def load(self, key: ModelKey, entry: _Entry) -> whisper.Whisper:
+        """
+        Load the model of an entry once, concurrent callers wait for the first load
+
+        :param key: (name, device, in_memory)
+        :param entry: entry returned by acquire
+        :return: whisper model
+        """
+        with entry.load_lock:
+            if entry.model is None:
+                name, device, in_memory = key
+                logger.info("Loading whisper model %s on %s", name, device)
+                entry.model = whisper.load_model(
+                    name=name,
+                    device=None if device == "auto" else device,
+                    download_root=entry.download_root,
+                    in_memory=in_memory,
+                )
+            return entry.model
+
+    def evict(self, key: ModelKey) -> bool:
+        """
+        Unload a model nobody references anymore
+
+        :param key: (name, device, in_memory)
+        :return: whether the model was unloaded
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refs:
+                return False
+            del self._entries[key]
+
+        logger.info("Unloading idle whisper model %s on %s", key[0], key[1])
+        with entry.load_lock:
+            entry.model = None
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return True
+
+    def loaded(self) -> List[ModelKey]:
+        """
+        :return: keys of the models currently loaded
+        """
+        with self._lock:
+            return [key for key, entry in self._entries.items() if entry.model is not None]
+
+
+# shared by every WhisperModel of the process
+registry = ModelRegistry()
+
+
+class MappedAudio(NamedTuple):
+    """
+    Sample range of a cached PCM file, sent to worker processes instead of the samples themselves
+    """
+
+    path: str
+    start: int
+    end: int
+    dtype: str
+
+    def open(self) -> np.ndarray:
+        dtype = np.dtype(self.dtype)
+        return np.memmap(
+            self.path, dtype=dtype, mode="c", offset=self.start * dtype.itemsize, shape=(self.end - self.start,)
+        )
+
+
+class AudioCache:
+    def __init__(
+        self, path: Union[str, Path] = DEFAULT_AUDIO_CACHE_DIR, max_size: int = 4 * 1024**3, dtype: str = "float32"
+    ) -> None:
+        """
+        Cache of decoded 16kHz PCM keyed by the hash of the audio file, so retries, other model sizes and chunk
+        workers skip ffmpeg and read the samples memory-mapped. Least recently used files are evicted past max_size.
+
+        :param path: cache directory
+        :param max_size: max total size in bytes
+        :param dtype: float32 is mapped as is, int16 halves the size but every read is converted to float32
+        """
+        if dtype not in ("float32", "int16"):
+            raise ValueError(f"Unsupported audio cache dtype {dtype}, use float32 or int16")
+        self.path = Path(path).expanduser()
+        self.max_size = max_size
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(path: Union[str, Path]) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(1 << 20):
+                h.update(block)
+        return h.hexdigest()
+
+    def load(self, path: Union[str, Path]) -> np.ndarray:
+        """
+        Decoded samples of an audio file, decoded with ffmpeg on the first call only
+
+        :param path: audio or video file path
+        :return: read-only-backed memmap (copy on write) of the samples
+        """
+        f = self.path / f"{self.key(path)}.{self.dtype}.pcm"
+
+        if f.exists():
+            self.hits += 1
+            # mtime is the LRU clock
+            os.utime(f)
+        else:
+            self.misses += 1
+            audio = whisper.load_audio(str(path))
+            if self.dtype == "int16":
+                audio = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp = f.with_suffix(f".{os.getpid()}.tmp")
+            audio.tofile(tmp)
+            os.replace(tmp, f)
+            self._evict(keep=f)
+
+        if f.stat().st_size == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(f, dtype=self.dtype, mode="c")
+
+    def _evict(self, keep: Path) -> None:
+        files = sorted(self.path.glob("*.pcm"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for p in files:
+            if total <= self.max_size:
+                break
+            if p == keep:
+                continue
+            total -= p.stat().st_size
+            # a worker still mapping it keeps reading the unlinked file
+            p.unlink(missing_ok=True)
+            logger.debug("Evicted cached audio %s", p)
+
+
+def _float_pcm(audio: np.ndarray) -> np.ndarray:
+    return audio.astype(np.float32) / 32768.0 if audio.dtype == np.int16 else audio
+
+
+def _mapped(audio: np.ndarray, start: int, end: int) -> Union[np.ndarray, MappedAudio]:
+    # only a whole cached file maps back to its path, anything else is sent as samples
+    if isinstance(audio, np.memmap) and audio.filename and audio.offset == 0 and isinstance(audio.base, mmap.mmap):
+        return MappedAudio(str(audio.filename), start, end, audio.dtype.name)
+    return audio[start:end]
+
+
+# dedicated to transcription, so long decodes never starve the default executor of the event loop
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_thread_pool_lock = threading.Lock()
+
+
+def transcription_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool transcriptions run in by default, created on first use
+
+    :return: ThreadPoolExecutor
+    """
+    global _thread_pool
+    with _thread_pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="yuisub-whisper")
+        return _thread_pool
+
+
+# models of a worker process, kept loaded for the next job of the same pool
+_process_models: Dict[ModelKey, "WhisperModel"] = {}
+
+
+def _transcribe_job(
+    key: ModelKey,
+    download_root: Optional[str],
+    audio: Union[str, np.ndarray, torch.Tensor],
+    chunk_length: Optional[float],
+    kwargs: Dict[str, Any],
+) -> SSAFile:
+    # runs in a worker process, every process loads its own copy of the model
+    model = _process_models.get(key)
+    if model is None:
+        name, device, in_memory = key
+        model = _process_models[key] = WhisperModel(
+            name=name, device=None if device == "auto" else device, download_root=download_root, in_memory=in_memory
+        )
+    return model._transcribe_sync(audio, chunk_length, None, kwargs)
+
+
+def split_on_silence(
+    audio: np.ndarray,
+    max_chunk_length: float = VAD_CHUNK_LENGTH,
+    min_silence: float = 0.5,
+    merge_gap: float = 2.0,
+    pad: float = 0.2,
+    frame_length: float = 0.03,
+    threshold: Optional[float] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Energy based voice activity detection, find the speech regions of the audio and pack them into chunks cut at
+    silences, the silent gaps between chunks are never decoded
+
+    :param audio: 16kHz mono audio
+    :param max_chunk_length: max chunk length in seconds, longer speech regions are cut hard
+    :param min_silence: shorter pauses don't end a speech region, seconds
+    :param merge_gap: neighbor regions closer than this are transcribed in one chunk, seconds
+    :param pad: seconds of audio kept around every region, whisper clips words cut too tightly
+    :param frame_length: analysis frame length in seconds
+    :param threshold: frame energy in dBFS below which a frame is silence, default is 15dB above the noise floor,
+        at most halfway to the loud frames, audio without quieter stretches is all speech
+    :return: (start, end) sample ranges, in order
+    """
+    frame = int(frame_length * SAMPLE_RATE)
+    n = len(audio) // frame
+    if n == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    frames = np.asarray(audio[: n * frame], dtype=np.float32).reshape(n, frame)
+    energy = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+    if threshold is None:
+        low, high = (float(p) for p in np.percentile(energy, [10, 90]))
+        if high - low < VAD_MIN_DYNAMIC_RANGE:
+            # no quieter stretches to cut at (music bed, dense dialogue, noise), every frame is speech
+            threshold = -np.inf
+        else:
+            # never above halfway between the floor and the loud frames, speech over a loud bed stays voiced
+            threshold = max(min(low + 15.0, (low + high) / 2), -50.0)
+
+    # voiced frames to regions, bridging pauses shorter than min_silence
+    regions: List[Tuple[int, int]] = []
+    gap = int(min_silence / frame_length)
+    for i in np.flatnonzero(energy > threshold):
+        if regions and i - regions[-1][1] <= gap:
+            regions[-1] = (regions[-1][0], int(i) + 1)
+        else:
+            regions.append((int(i), int(i) + 1))
+
+    padding, step, merge = int(pad * SAMPLE_RATE), int(max_chunk_length * SAMPLE_RATE), int(merge_gap * SAMPLE_RATE)
+    if not regions:
+        # better transcribe some silence than drop the whole audio on a bad threshold
+        logger.warning("No speech found at %.1f dBFS, transcribing the whole audio", threshold)
+        return [(s, min(s + step, len(audio))) for s in range(0, len(audio), step)]
+
+    chunks: List[Tuple[int, int]] = []
+    for first, last in regions:
+        start, end = max(0, first * frame - padding), min(len(audio), last * frame + padding)
+        if chunks and start < chunks[-1][1]:
+            start = chunks[-1][1]
+        if chunks and start - chunks[-1][1] <= merge and end - chunks[-1][0] <= step:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        chunks.extend((s, min(s + step, end)) for s in range(start, end, step))
+
+    return chunks
+
+
+def _stitch(chunks: List[Tuple[int, int]], subs: List[SSAFile]) -> SSAFile:
+    """
+    Shift the events of every chunk back to the timeline of the whole audio
+
+    :param chunks: (start, end) sample ranges
+    :param subs: transcription of every chunk
+    :return: SSAFile
+    """
+    sub = SSAFile()
+    for (start, end), chunk_sub in zip(chunks, subs):
+        offset, limit = round(start * 1000 / SAMPLE_RATE), round(end * 1000 / SAMPLE_RATE)
+        for e in chunk_sub:
+            e.start = min(e.start + offset, limit)
+            e.end = min(e.end + offset, limit)
+            sub.append(e)
+    return sub
 
 
 class WhisperModel:
@@ -14,8 +375,57 @@ class WhisperModel:
         device: Optional[Union[str, torch.device]] = None,
         download_root: Optional[str] = None,
         in_memory: bool = False,
+        shared: bool = True,
+        audio_cache: Optional[AudioCache] = None,
     ):
-        self.model = whisper.load_model(name=name, device=device, download_root=download_root, in_memory=in_memory)
+        """
+        Whisper model, loaded on first transcription
+
+        :param name: whisper model name
+        :param device: torch device, default is whisper's choice
+        :param download_root: whisper download root
+        :param in_memory: preload the model weights into host memory
+        :param shared: share the weights (and a decode queue) with every WhisperModel of the same name, device and
+            in_memory through the process-wide registry, False for a private copy
+        :param audio_cache: decode audio files once and read them memory-mapped from then on
+        """
+        self.key: ModelKey = (name, "auto" if device is None else str(device), in_memory)
+        self.download_root = download_root
+        self.audio_cache = audio_cache
+        self.registry = registry if shared else ModelRegistry(idle_timeout=None)
+        self._entry = self.registry.acquire(self.key, download_root)
+        self._finalizer = weakref.finalize(self, self.registry.release, self.key)
+
+    @property
+    def model(self) -> whisper.Whisper:
+        return self.registry.load(self.key, self._entry)
+
+    def close(self) -> None:
+        """
+        Release the model, it is unloaded once idle if no other WhisperModel uses it
+        """
+        self._finalizer()
+
+    def load_audio(self, audio: Union[str, np.ndarray, torch.Tensor, MappedAudio]) -> Union[np.ndarray, torch.Tensor]:
+        """
+        Decode an audio file (through the audio cache if set), arrays and tensors are passed through
+
+        :param audio: audio file path, numpy array, torch tensor or MappedAudio
+        :return: 16kHz mono float32 samples
+        """
+        if isinstance(audio, MappedAudio):
+            return _float_pcm(audio.open())
+        if isinstance(audio, str):
+            return _float_pcm(self.audio_cache.load(audio)) if self.audio_cache else whisper.load_audio(audio)
+        if isinstance(audio, np.ndarray):
+            return _float_pcm(audio)
+        return audio
+
+    def _transcribe(self, **kwargs: Any) -> Dict[str, Any]:
+        kwargs["audio"] = self.load_audio(kwargs["audio"])
+        model = self.model
+        with self._entry.decode_lock:
+            return model.transcribe(**kwargs)
 
     def transcribe(
         self,
@@ -31,7 +441,7 @@ class WhisperModel:
         prepend_punctuations: str = "\"'“¿([{-",
         append_punctuations: str = "\"'.。,，!！?？:：”)]}、",
     ) -> SSAFile:
-        result = self.model.transcribe(
+        result = self._transcribe(
             audio=audio,
             verbose=verbose,
             temperature=temperature,
@@ -45,3 +455,195 @@ class WhisperModel:
             append_punctuations=append_punctuations,
         )
         return pysubs2.load_from_whisper(result)
+
+    def transcribe_iter(
+        self,
+        audio: Union[str, np.ndarray, torch.Tensor],
+        chunk_length: float = 120.0,
+        verbose: Optional[bool] = False,
+        condition_on_previous_text: bool = True,
+        initial_prompt: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Iterator[SSAEvent]:
+        """
+        Transcribe audio chunk by chunk, yielding events as soon as each chunk is decoded
+
+        :param audio: audio file path or numpy array or torch tensor, 16kHz mono
+        :param chunk_length: chunk length in seconds
+        :param verbose: whisper verbose
+        :param condition_on_previous_text: carry the tail of the previous chunk over as the prompt of the next one
+        :param initial_prompt: prompt of the first chunk
+        :param kwargs: other whisper transcribe options
+        :return: iterator of SSAEvent, timestamps relative to the whole audio
+        """
+        audio = self.load_audio(audio)
+
+        step = int(chunk_length * SAMPLE_RATE)
+        prompt = initial_prompt
+
+        for start in range(0, len(audio), step):
+            result = self._transcribe(
+                audio=audio[start : start + step],
+                verbose=verbose,
+                condition_on_previous_text=condition_on_previous_text,
+                initial_prompt=prompt,
+                **kwargs,
+            )
+
+            offset = start / SAMPLE_RATE
+            segments: List[Dict[str, Any]] = [
+                {"start": s["start"] + offset, "end": s["end"] + offset, "text": s["text"]} for s in result["segments"]
+            ]
+            yield from pysubs2.load_from_whisper(segments)
+
+            if condition_on_previous_text and result["text"].strip():
+                prompt = result["text"].strip()[-200:]
+
+    async def transcribe_stream(
+        self,
+        audio: Union[str, np.ndarray, torch.Tensor],
+        chunk_length: float = 120.0,
+        **kwargs: Any,
+    ) -> AsyncIterator[SSAEvent]:
+        """
+        Transcribe audio in a worker thread, yielding events to the event loop as they are decoded
+
+        :param audio: audio file path or numpy array or torch tensor
+        :param chunk_length: chunk length in seconds
+        :param kwargs: transcribe_iter options
+        :return: async iterator of SSAEvent
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[Union[SSAEvent, BaseException, None]] = asyncio.Queue()
+        cancel = threading.Event()
+
+        def _worker() -> None:
+            try:
+                for event in self.transcribe_iter(audio, chunk_length=chunk_length, **kwargs):
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+                    # the consumer is gone, stop before decoding the next chunk
+                    if cancel.is_set():
+                        break
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        worker = loop.run_in_executor(transcription_executor(), _worker)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            cancel.set()
+
+        await worker
+
+    def _transcribe_sync(
+        self,
+        audio: Union[str, np.ndarray, torch.Tensor],
+        chunk_length: Optional[float],
+        cancel: Optional[threading.Event],
+        kwargs: Dict[str, Any],
+    ) -> SSAFile:
+        if chunk_length is None:
+            return self.transcribe(audio, **kwargs)
+
+        sub = SSAFile()
+        for event in self.transcribe_iter(audio, chunk_length=chunk_length, **kwargs):
+            sub.append(event)
+            if cancel is not None and cancel.is_set():
+                raise asyncio.CancelledError()
+        return sub
+
+    async def atranscribe(
+        self,
+        audio: Union[str, np.ndarray, torch.Tensor],
+        chunk_length: Optional[float] = None,
+        executor: Optional[Executor] = None,
+        **kwargs: Any,
+    ) -> SSAFile:
+        """
+        Transcribe without blocking the event loop, in a thread (default) or in a process pool.
+        With a ProcessPoolExecutor several episodes transcribe in parallel on their own copy of the model,
+        threads share this model and take turns on it.
+
+        :param audio: audio file path or numpy array or torch tensor
+        :param chunk_length: transcribe chunk by chunk (see transcribe_iter), a cancelled transcription then stops
+            after the current chunk, None to transcribe the whole audio at once, which can only be abandoned
+        :param executor: executor to run in, default is a thread pool dedicated to transcription,
+            a ProcessPoolExecutor should use the spawn start method
+        :param kwargs: transcribe or transcribe_iter options
+        :return: SSAFile
+        """
+        loop = asyncio.get_running_loop()
+
+        if executor is not None and not isinstance(executor, ThreadPoolExecutor):
+            # workers map the cached samples instead of decoding the file again
+            if isinstance(audio, str) and self.audio_cache is not None:
+                samples = await loop.run_in_executor(transcription_executor(), self.audio_cache.load, audio)
+                audio = _mapped(samples, 0, len(samples))
+            # a queued job is dropped on cancel, a running one finishes in its process and is discarded
+            return await loop.run_in_executor(
+                executor, _transcribe_job, self.key, self.download_root, audio, chunk_length, kwargs
+            )
+
+        cancel = threading.Event()
+        future = loop.run_in_executor(
+            executor or transcription_executor(), self._transcribe_sync, audio, chunk_length, cancel, kwargs
+        )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    async def atranscribe_chunked(
+        self,
+        audio: Union[str, np.ndarray, torch.Tensor],
+        executor: Optional[Executor] = None,
+        max_chunk_length: float = VAD_CHUNK_LENGTH,
+        min_silence: float = 0.5,
+        **kwargs: Any,
+    ) -> SSAFile:
+        """
+        Split the audio at silences (see split_on_silence) and transcribe the speech chunks concurrently, then
+        stitch them back into one subtitle. Chunks run in parallel with a ProcessPoolExecutor, in a thread they only
+        save the decoding of silence. The previous text is never carried over a chunk boundary.
+
+        :param audio: audio file path or numpy array or torch tensor
+        :param executor: executor to run the chunks in, see atranscribe
+        :param max_chunk_length: max chunk length in seconds
+        :param min_silence: shorter pauses don't split the audio, seconds
+        :param kwargs: transcribe options
+        :return: SSAFile
+        """
+        if isinstance(audio, str):
+            loop = asyncio.get_running_loop()
+            load = self.audio_cache.load if self.audio_cache is not None else whisper.load_audio
+            samples: np.ndarray = await loop.run_in_executor(transcription_executor(), load, audio)
+        elif isinstance(audio, torch.Tensor):
+            samples = audio.cpu().numpy()
+        else:
+            samples = audio
+
+        chunks = split_on_silence(_float_pcm(samples), max_chunk_length=max_chunk_length, min_silence=min_silence)
+        speech = sum(end - start for start, end in chunks) / max(1, len(samples))
+        logger.info("Transcribing %d chunks, %.0f%% of the audio", len(chunks), speech * 100)
+
+        # process workers get the cached file and a range, not a pickled copy of the samples
+        process = executor is not None and not isinstance(executor, ThreadPoolExecutor)
+        subs = await asyncio.gather(
+            *[
+                self.atranscribe(
+                    _mapped(samples, start, end) if process else samples[start:end], executor=executor, **kwargs
+                )
+                for start, end in chunks
+            ]
+        )
+        return _stitch(chunks, list(subs))
@@ -1,10 +1,21 @@
 import asyncio
+import logging
+import os
 import re
-from typing import Any, Dict, List, Optional
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import urlparse
 
 import httpx
 from pydantic import BaseModel
 
+from yuisub.client import create_http_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "yuisub" / "bangumi"
+
 
 class Character(BaseModel):
     id: int
@@ -17,6 +28,113 @@ class BGM(BaseModel):
     characters: str
 
 
+class CacheEntry(BaseModel):
+    url: str
+    body: Any
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float
+
+
+class BangumiCache:
+    def __init__(
+        self, path: Union[str, Path] = DEFAULT_CACHE_DIR, ttl: float = 7 * 24 * 3600, offline: bool = False
+    ) -> None:
+        """
+        Local cache of api.bgm.tv responses, one json file per api path (subjects/<id>.json, characters/<id>.json...).
+        Fresh entries are served without network, stale entries are revalidated with ETag/If-Modified-Since
+        and served as is when api.bgm.tv is unreachable.
+
+        :param path: cache directory
+        :param ttl: seconds an entry is served without revalidation
+        :param offline: serve only from cache, never touch the network
+        """
+        self.path = Path(path).expanduser()
+        self.ttl = ttl
+        self.offline = offline
+
+    def _file(self, url: str) -> Path:
+        api_path = urlparse(url).path.strip("/")
+        if api_path.startswith("v0/"):
+            api_path = api_path[3:]
+        return self.path / f"{api_path}.json"
+
+    def load(self, url: str) -> Optional[CacheEntry]:
+        f = self._file(url)
+        if not f.exists():
+            return None
+        try:
+            return CacheEntry.model_validate_json(f.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning("Broken bangumi cache entry %s: %s", f, e)
+            return None
+
+    def save(self, entry: CacheEntry) -> None:
+        f = self._file(entry.url)
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_suffix(".json.tmp")
+        tmp.write_text(entry.model_dump_json(), encoding="utf-8")
+        os.replace(tmp, f)
+
+    async def get(self, client: httpx.AsyncClient, url: str) -> httpx.Response:
+        """
+        GET url through the cache
+
+        :param client: httpx.AsyncClient
+        :param url: api url
+        :return: httpx.Response, 504 if offline and not cached
+        """
+        request = httpx.Request("GET", url)
+        entry = self.load(url)
+
+        if entry is not None and (self.offline or time.time() - entry.fetched_at < self.ttl):
+            return httpx.Response(200, json=entry.body, request=request)
+
+        if self.offline:
+            return httpx.Response(504, request=request)
+
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            response = await client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            if entry is None:
+                raise
+            logger.warning("%s, serving stale bangumi cache for %s", e, url)
+            return httpx.Response(200, json=entry.body, request=request)
+
+        if response.status_code == 304 and entry is not None:
+            entry.fetched_at = time.time()
+            self.save(entry)
+            return httpx.Response(200, json=entry.body, request=request)
+
+        if response.status_code == 200:
+            self.save(
+                CacheEntry(
+                    url=url,
+                    body=response.json(),
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    fetched_at=time.time(),
+                )
+            )
+            return response
+
+        if entry is not None and response.status_code >= 500:
+            logger.warning("Bangumi api returned %d, serving stale cache for %s", response.status_code, url)
+            return httpx.Response(200, json=entry.body, request=request)
+
+        return response
+
+
+async def _get(client: httpx.AsyncClient, url: str, cache: Optional[BangumiCache] = None) -> httpx.Response:
+    return await cache.get(client, url) if cache is not None else await client.get(url)
+
+
 async def extract_bangumi_id(url: str) -> Optional[str]:
     """
     Extract bangumi ID from Bangumi URL
@@ -40,7 +158,10 @@ def construct_api_url(bangumi_id: str) -> str:
 
 
 async def get_character_info(
-    client: httpx.AsyncClient, character: Dict[str, Any], semaphore: asyncio.Semaphore
+    client: httpx.AsyncClient,
+    character: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    cache: Optional[BangumiCache] = None,
 ) -> Character:
     """
     Get detailed info of a character
@@ -48,6 +169,7 @@ async def get_character_info(
     :param client: httpx.AsyncClient
     :param character: Character data
     :param semaphore: asyncio.Semaphore
+    :param cache: BangumiCache
     :return: Character object
     """
     async with semaphore:
@@ -55,7 +177,7 @@ async def get_character_info(
         char_name = character["name"]
         url = f"https://api.bgm.tv/v0/characters/{char_id}"
 
-        response = await client.get(url)
+        response = await _get(client, url, cache)
         if response.status_code != 200:
             return Character(id=char_id, name=char_name)
 
@@ -70,12 +192,15 @@ async def get_character_info(
         return Character(id=char_id, name=char_name, chinese_name=chinese_name)
 
 
-async def fetch_bangumi_data(client: httpx.AsyncClient, url: str) -> tuple[str, List[Dict[str, Any]]]:
+async def fetch_bangumi_data(
+    client: httpx.AsyncClient, url: str, cache: Optional[BangumiCache] = None
+) -> tuple[str, List[Dict[str, Any]]]:
     """
     Get base info and character list asynchronously
 
     :param client: httpx.AsyncClient
     :param url: Bangumi URL
+    :param cache: BangumiCache
     :return: Tuple of introduction and character list
     """
     bangumi_id = await extract_bangumi_id(url)
@@ -86,7 +211,7 @@ async def fetch_bangumi_data(client: httpx.AsyncClient, url: str) -> tuple[str,
     chars_url = f"{api_url}/characters"
 
     # 并发请求番剧信息和角色列表
-    response_info, response_chars = await asyncio.gather(client.get(api_url), client.get(chars_url))
+    response_info, response_chars = await asyncio.gather(_get(client, api_url, cache), _get(client, chars_url, cache))
 
     if response_info.status_code != 200 or response_chars.status_code != 200:
         raise Exception("Failed to fetch bangumi data")
@@ -94,60 +219,84 @@ async def fetch_bangumi_data(client: httpx.AsyncClient, url: str) -> tuple[str,
     return response_info.json()["summary"], response_chars.json()
 
 
-async def bangumi(url: Optional[str] = None, token: Optional[str] = None) -> BGM:
+def create_bangumi_client(token: Optional[str] = None, **kwargs: Any) -> httpx.AsyncClient:
+    """
+    Build a pooled client for api.bgm.tv
+
+    :param token: Bangumi access token
+    :param kwargs: create_http_client options (http2, pool limits)
+    :return: httpx.AsyncClient
+    """
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        "Accept": "*/*",
+        "Host": "api.bgm.tv",
+        "Connection": "keep-alive",
+    }
+
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    kwargs.setdefault("timeout", 30.0)
+    return create_http_client(headers=headers, **kwargs)
+
+
+async def bangumi(
+    url: Optional[str] = None,
+    token: Optional[str] = None,
+    cache: Optional[BangumiCache] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> BGM:
     """
     Get bangumi info and character list asynchronously
 
     :param url: Bangumi URL
+    :param token: Bangumi access token, ignored when client is given
+    :param cache: BangumiCache, None to always fetch from api.bgm.tv
+    :param client: shared client from create_bangumi_client, None to open a new one for this call
     :return: BGM object
     """
-    print("Getting bangumi info...")
-
-    SEMAPHORE_LIMIT = 32
+    logger.info("Getting bangumi info...")
 
     if not url:
-        print("Warning: bangumi url is empty")
+        logger.warning("Bangumi url is empty")
         return BGM(introduction="", characters="")
 
     # 去除URL末尾的"/"
     if url[-1] == "/":
         url = url[:-1]
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Accept": "*/*",
-        "Host": "api.bgm.tv",
-        "Connection": "keep-alive",
-    }
+    if client is None:
+        async with create_bangumi_client(token) as client:
+            return await _bangumi(client, url, cache)
 
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
+    return await _bangumi(client, url, cache)
 
-    async with httpx.AsyncClient(headers=headers, timeout=30.0) as client:
-        try:
-            # 获取基本信息和角色列表
-            if url:
-                introduction, characters_data = await fetch_bangumi_data(client, url)
-            else:
-                raise ValueError("Invalid bangumi URL")
 
-            # 创建信号量控制并发请求数
-            semaphore = asyncio.Semaphore(SEMAPHORE_LIMIT)
+async def _bangumi(client: httpx.AsyncClient, url: str, cache: Optional[BangumiCache] = None) -> BGM:
+    SEMAPHORE_LIMIT = 32
 
-            # 并发获取所有角色的详细信息
-            character_tasks = [get_character_info(client, char, semaphore) for char in characters_data]
-            characters_info = await asyncio.gather(*character_tasks)
+    try:
+        # 获取基本信息和角色列表
+        introduction, characters_data = await fetch_bangumi_data(client, url, cache)
 
-            # 格式化角色信息
-            characters_text = ""
-            for char in characters_info:
-                if char.chinese_name:
-                    characters_text += f"{char.name} / {char.chinese_name}\n"
-                else:
-                    characters_text += f"{char.name}\n"
+        # 创建信号量控制并发请求数
+        semaphore = asyncio.Semaphore(SEMAPHORE_LIMIT)
 
-            return BGM(introduction=introduction, characters=characters_text)
+        # 并发获取所有角色的详细信息
+        character_tasks = [get_character_info(client, char, semaphore, cache) for char in characters_data]
+        characters_info = await asyncio.gather(*character_tasks)
 
-        except Exception as e:
-            print(f"Error fetching bangumi info: {e}")
-            raise
+        # 格式化角色信息
+        characters_text = ""
+        for char in characters_info:
+            if char.chinese_name:
+                characters_text += f"{char.name} / {char.chinese_name}\n"
+            else:
+                characters_text += f"{char.name}\n"
+
+        return BGM(introduction=introduction, characters=characters_text)
+
+    except Exception as e:
+        logger.error("Error fetching bangumi info: %s", e)
+        raise
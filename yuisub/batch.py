@@ -0,0 +1,193 @@
+import asyncio
+import glob
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from yuisub.sub import SubtitleStream, TranslationStats
+from yuisub.translator import SubtitleTranslator
+
+logger = logging.getLogger(__name__)
+
+SUB_SUFFIXES = (".ass", ".ssa", ".srt", ".vtt", ".sub")
+AUDIO_SUFFIXES = (".mp3", ".wav", ".flac", ".m4a", ".aac", ".ogg", ".opus", ".mkv", ".mp4", ".webm")
+
+
+class Episode(BaseModel):
+    input: str
+    status: str = "pending"  # pending | done | failed
+    zh: Optional[str] = None
+    bilingual: Optional[str] = None
+    elapsed: Optional[float] = None
+    error: Optional[str] = None
+
+
+class Manifest(BaseModel):
+    episodes: Dict[str, Episode] = {}
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Manifest":
+        """
+        Load manifest from path, empty manifest if it doesn't exist
+
+        :param path: manifest json path
+        :return: Manifest
+        """
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        return cls.model_validate_json(path.read_text(encoding="utf-8"))
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Write manifest atomically, so an interrupted run never leaves a broken file behind
+
+        :param path: manifest json path
+        """
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(self.model_dump_json(indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def is_batch_input(path: str) -> bool:
+    """
+    Whether the input is a directory or a glob pattern
+
+    :param path: input path
+    :return: bool
+    """
+    return Path(path).is_dir() or glob.has_magic(path)
+
+
+def expand_inputs(path: str, suffixes: tuple[str, ...]) -> List[Path]:
+    """
+    Expand a directory or glob pattern into a sorted list of episode files
+
+    :param path: directory, glob pattern or file path
+    :param suffixes: accepted file suffixes when path is a directory
+    :return: list of file paths
+    """
+    p = Path(path)
+    if p.is_dir():
+        files = [f for f in p.iterdir() if f.is_file() and f.suffix.lower() in suffixes]
+    elif glob.has_magic(path):
+        files = [Path(f) for f in glob.glob(path) if Path(f).is_file()]
+    else:
+        files = [p]
+    return sorted(files)
+
+
+def output_stems(inputs: List[Path]) -> Dict[Path, str]:
+    """
+    Output name of every episode, its file stem, or its path relative to the other episodes of the same stem
+    (e.g. S1/ep01 and S2/ep01, or ep01.srt and ep01.ass) so no two episodes share an output
+
+    :param inputs: episode files
+    :return: output stem of every input, may contain directories
+    """
+    groups: Dict[str, List[Path]] = {}
+    for f in inputs:
+        groups.setdefault(f.stem, []).append(f)
+
+    stems = {}
+    for stem, files in groups.items():
+        if len(files) == 1:
+            stems[files[0]] = stem
+            continue
+        root = Path(os.path.commonpath([str(f.absolute()) for f in files]))
+        relative = [f.absolute().relative_to(root) for f in files]
+        names = [r.with_suffix("").as_posix() for r in relative]
+        # same directory, different suffix
+        if len(set(names)) < len(names):
+            names = [r.as_posix() for r in relative]
+        stems.update(zip(files, names))
+    return stems
+
+
+async def translate_batch(
+    translator: SubtitleTranslator,
+    inputs: List[Path],
+    output_dir: Union[str, Path],
+    audio: bool = False,
+    jobs: int = 2,
+    manifest_path: Optional[Union[str, Path]] = None,
+    stream_output: bool = False,
+) -> Manifest:
+    """
+    Translate a season of episodes with one SubtitleTranslator, episodes share the whisper model, bangumi info
+    and the llm scheduler. Progress is written to a manifest, episodes already done are skipped on the next run.
+
+    :param translator: SubtitleTranslator
+    :param inputs: episode files
+    :param output_dir: output directory, <stem>.zh.ass and <stem>.bilingual.ass are written there,
+        <stem>.journal.jsonl checkpoints an unfinished episode, see output_stems for episodes sharing a stem
+    :param audio: inputs are audio files
+    :param jobs: max episodes translated concurrently
+    :param manifest_path: manifest json path, default is output_dir/yuisub-manifest.json
+    :param stream_output: write the subtitles while translating instead of holding every episode in memory
+    :return: Manifest
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = output_dir / "yuisub-manifest.json"
+
+    manifest = Manifest.load(manifest_path)
+    pending = [f for f in inputs if manifest.episodes.get(str(f), Episode(input=str(f))).status != "done"]
+    total, finished = len(inputs), len(inputs) - len(pending)
+    logger.info("Batch: %d episodes, %d already done, %d pending", total, finished, len(pending))
+
+    semaphore = asyncio.Semaphore(max(1, jobs))
+    stems = output_stems(inputs)
+
+    async def _episode(f: Path) -> None:
+        nonlocal finished
+        async with semaphore:
+            episode = Episode(input=str(f))
+            t = time.perf_counter()
+            stats = TranslationStats()
+            journal_path = output_dir / f"{stems[f]}.journal.jsonl"
+            zh_path = output_dir / f"{stems[f]}.zh.ass"
+            bilingual_path = output_dir / f"{stems[f]}.bilingual.ass"
+            zh_path.parent.mkdir(parents=True, exist_ok=True)
+            sub, audio_path = (None, str(f)) if audio else (f, None)
+            try:
+                if stream_output:
+                    with SubtitleStream(zh_path=zh_path, bilingual_path=bilingual_path) as output:
+                        await translator.get_subtitles(
+                            sub=sub, audio=audio_path, stats=stats, journal_path=journal_path, output=output
+                        )
+                else:
+                    sub_zh, sub_bilingual = await translator.get_subtitles(
+                        sub=sub, audio=audio_path, stats=stats, journal_path=journal_path
+                    )
+                    sub_zh.save(zh_path)
+                    sub_bilingual.save(bilingual_path)
+
+                episode.zh = str(zh_path)
+                episode.bilingual = str(bilingual_path)
+                episode.status = "done"
+
+                # saved with the origin text of the failed lines, the next run resumes from the journal
+                if stats.failed_lines:
+                    episode.status = "failed"
+                    episode.error = f"{stats.failed_lines} lines failed to translate"
+
+            except Exception as e:
+                episode.status = "failed"
+                episode.error = repr(e)
+
+            episode.elapsed = time.perf_counter() - t
+            manifest.episodes[str(f)] = episode
+            manifest.save(manifest_path)
+
+            finished += 1
+            logger.info("Batch: [%d/%d] %s %s in %.1fs", finished, total, f.name, episode.status, episode.elapsed)
+
+    await asyncio.gather(*[_episode(f) for f in pending])
+    return manifest
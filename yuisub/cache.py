@@ -0,0 +1,131 @@
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional, Union
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "yuisub" / "translation.db"
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize subtitle text for cache lookup, NFKC + collapsed whitespace
+
+    :param text: text
+    :return: normalized text
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(text: str, model: str, prompt: str) -> str:
+    """
+    Cache key of a line, normalized text + model name + hash of the system prompt
+
+    :param text: origin text
+    :param model: llm model name
+    :param prompt: system prompt
+    :return: sha256 hex digest
+    """
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256("\0".join([model, prompt_hash, normalize(text)]).encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_CACHE_PATH,
+        max_entries: Optional[int] = 1_000_000,
+        max_age: Optional[float] = 90 * 24 * 3600,
+    ) -> None:
+        """
+        Persistent ORIGIN -> ZH translation memory on local disk (SQLite)
+
+        :param path: sqlite database path, ":memory:" for a process-local cache
+        :param max_entries: max cached lines, least recently used lines are evicted first
+        :param max_age: max age of a cached line in seconds
+        """
+        if str(path) != ":memory:":
+            path = Path(path).expanduser()
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS translation ("
+            "key TEXT PRIMARY KEY, zh TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS translation_accessed ON translation (accessed)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, text: str, model: str, prompt: str) -> Optional[str]:
+        """
+        Look up a cached translation
+
+        :param text: origin text
+        :param model: llm model name
+        :param prompt: system prompt
+        :return: translated text or None
+        """
+        key = cache_key(text, model, prompt)
+        now = time.time()
+        row = self.conn.execute("SELECT zh, created FROM translation WHERE key = ?", (key,)).fetchone()
+
+        if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+            self.misses += 1
+            return None
+
+        self.conn.execute("UPDATE translation SET accessed = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return str(row[0])
+
+    def set(self, text: str, zh: str, model: str, prompt: str) -> None:
+        """
+        Store a translation
+
+        :param text: origin text
+        :param zh: translated text
+        :param model: llm model name
+        :param prompt: system prompt
+        """
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO translation (key, zh, created, accessed) VALUES (?, ?, ?, ?)",
+            (cache_key(text, model, prompt), zh, now, now),
+        )
+        self.conn.commit()
+
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Drop expired lines, then the least recently used lines above max_entries
+        """
+        if self.max_age is not None:
+            self.conn.execute("DELETE FROM translation WHERE created < ?", (time.time() - self.max_age,))
+
+        if self.max_entries is not None:
+            self.conn.execute(
+                "DELETE FROM translation WHERE key IN "
+                "(SELECT key FROM translation ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return int(self.conn.execute("SELECT COUNT(*) FROM translation").fetchone()[0])
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,44 @@
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def create_http_client(
+    http2: bool = False,
+    max_connections: Optional[int] = 100,
+    max_keepalive_connections: Optional[int] = 20,
+    keepalive_expiry: Optional[float] = 30.0,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 60.0,
+) -> httpx.AsyncClient:
+    """
+    Build a pooled httpx.AsyncClient, meant to be long-lived and shared between requests
+
+    :param http2: enable HTTP/2, needs the optional h2 package, falls back to HTTP/1.1 without it
+    :param max_connections: max pooled connections
+    :param max_keepalive_connections: max idle connections kept alive
+    :param keepalive_expiry: seconds an idle connection is kept alive
+    :param headers: default headers
+    :param timeout: request timeout in seconds
+    :return: httpx.AsyncClient
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("h2 is not installed, falling back to HTTP/1.1, run `pip install httpx[http2]` to enable it")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        headers=headers,
+        timeout=timeout,
+    )
@@ -0,0 +1,76 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class Event(BaseModel):
+    kind: str  # stage | critical | request | retry | cache
+    name: str
+    elapsed: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    estimated_tokens: int = 0  # prompt size counted before sending, for providers without usage
+    attempt: int = 0
+    hit: bool = False
+
+
+Callback = Callable[[Event], None]
+
+
+class Instrumentation:
+    def __init__(self, callbacks: Optional[List[Callback]] = None) -> None:
+        """
+        Event emitter for stage timings, llm request latency and token usage, retries and cache lookups
+
+        :param callbacks: called with every Event, in order
+        """
+        self.callbacks: List[Callback] = list(callbacks) if callbacks else []
+
+    def on(self, callback: Callback) -> Callback:
+        """
+        Register a callback, can be used as a decorator
+
+        :param callback: called with every Event
+        :return: callback
+        """
+        self.callbacks.append(callback)
+        return callback
+
+    def bind(self, callback: Optional[Callback]) -> "Instrumentation":
+        """
+        Copy of this instrumentation with one more callback, e.g. to collect the events of one episode
+
+        :param callback: extra callback, ignored if None or already registered
+        :return: Instrumentation
+        """
+        if callback is None or callback in self.callbacks:
+            return self
+        return Instrumentation([*self.callbacks, callback])
+
+    def emit(self, event: Event) -> None:
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception:
+                # a broken callback must never break a translation
+                logger.exception("Instrumentation callback failed on %s", event)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage, the event is emitted even if the stage fails
+
+        :param name: stage name, e.g. whisper, bangumi, summary, translate
+        """
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t
+            logger.debug("Stage %s took %.2fs", name, elapsed)
+            self.emit(Event(kind="stage", name=name, elapsed=elapsed))
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from yuisub.cache import normalize
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    def __init__(self, path: Union[str, Path], model: str) -> None:
+        """
+        Append-only JSONL checkpoint of one episode, every translated line (and summary) is written as soon as it
+        is done, so a retry or a re-run only sends the lines still missing
+
+        :param path: journal path, usually a sidecar of the output subtitle
+        :param model: llm model name, a journal written by another model is discarded
+        """
+        self.path = Path(path).expanduser()
+        self.model = model
+        self.entries: Dict[str, str] = {}
+
+        if self.path.exists() and self._load():
+            self.file = self.path.open("a", encoding="utf-8")
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = self.path.open("w", encoding="utf-8")
+            self._write({"model": model})
+
+    def _load(self) -> bool:
+        with self.path.open(encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may be cut off by a crash
+                    logger.warning("Skipping broken line %d of journal %s", i + 1, self.path)
+                    continue
+
+                if i == 0:
+                    if record.get("model") != self.model:
+                        logger.warning("Journal %s was written by another model, starting over", self.path)
+                        return False
+                    continue
+
+                self.entries[record["key"]] = record["zh"]
+
+        return True
+
+    def _write(self, record: Dict[str, str]) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    @staticmethod
+    def key(kind: str, text: str) -> str:
+        return hashlib.sha256(f"{kind}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, kind: str, text: str) -> Optional[str]:
+        """
+        Look up a checkpointed result
+
+        :param kind: line or summary
+        :param text: origin text
+        :return: translated text or None
+        """
+        return self.entries.get(self.key(kind, text))
+
+    def put(self, kind: str, text: str, zh: str) -> None:
+        """
+        Checkpoint a result
+
+        :param kind: line or summary
+        :param text: origin text
+        :param zh: translated text
+        """
+        key = self.key(kind, text)
+        self.entries[key] = zh
+        self._write({"key": key, "zh": zh})
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def remove(self) -> None:
+        """
+        Close and delete the journal, once the episode is complete
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
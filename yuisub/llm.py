@@ -1,66 +1,661 @@
+import asyncio
 import json
-from typing import Optional
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar
 
-import openai
-from openai import AsyncOpenAI
-from tenacity import retry, stop_after_attempt, wait_random
+import httpx
+from pydantic import BaseModel
+from tenacity import RetryCallState, retry, stop_after_attempt, wait_random
 
 from yuisub.bangumi import BGM
-from yuisub.prompt import ORIGIN, ZH, anime_prompt, summary_prompt
+from yuisub.cache import TranslationCache
+from yuisub.instrument import Event, Instrumentation
+from yuisub.prompt import (
+    ORIGIN,
+    ORIGIN_BATCH,
+    ZH,
+    ZH_BATCH,
+    anime_prompt,
+    estimate_tokens,
+    merge_summary_prompt,
+    summary_prompt,
+)
+from yuisub.scheduler import Hedger, Scheduler
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def create_llm_client(
+    api_key: str,
+    base_url: str,
+    http_client: Optional[httpx.AsyncClient] = None,
+    max_retries: Optional[int] = None,
+) -> "AsyncOpenAI":
+    """
+    Build an OpenAI compatible client, share it between Translator and Summarizer instances to reuse connections
+
+    :param api_key: llm api key
+    :param base_url: llm base url
+    :param http_client: pooled httpx.AsyncClient, see yuisub.client.create_http_client
+    :param max_retries: retries inside the openai client, None for its default
+    :return: AsyncOpenAI
+    """
+    # openai is most of the import time of yuisub, it's imported when the first client is built
+    from openai import AsyncOpenAI
+
+    if max_retries is None:
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+
+
+class Endpoint(BaseModel):
+    base_url: str
+    api_key: str
+    model: Optional[str] = None
+    weight: float = 1.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Endpoint":
+        """
+        Parse a CLI endpoint, "base_url,key=api_key,model=name,weight=2", everything but base_url is optional
+
+        :param spec: endpoint spec
+        :return: Endpoint
+        """
+        base_url, *options = [s.strip() for s in spec.split(",")]
+        fields: Dict[str, Any] = {"base_url": base_url, "api_key": ""}
+        for option in options:
+            name, sep, value = option.partition("=")
+            if not sep or name not in ("key", "model", "weight"):
+                raise ValueError(f"Invalid endpoint option {option!r} in {spec!r}")
+            fields["api_key" if name == "key" else name] = value
+        return cls(**fields)
+
+
+class EndpointPool:
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        http_client_factory: Optional[Callable[[Endpoint], httpx.AsyncClient]] = None,
+    ) -> None:
+        """
+        Weighted pool of OpenAI compatible endpoints. Requests go to the least loaded healthy endpoint, an endpoint
+        failing failure_threshold times in a row (connection errors, 429) is skipped for cooldown seconds.
+
+        :param endpoints: endpoints, at least one
+        :param failure_threshold: consecutive failures that open the circuit breaker of an endpoint
+        :param cooldown: seconds an endpoint is skipped once its breaker is open
+        :param http_client_factory: build the httpx client of an endpoint, e.g. a pooled one or a stub in tests
+        """
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # no retries inside the client, failing over to another endpoint is faster
+        self.clients = [
+            create_llm_client(
+                e.api_key,
+                e.base_url,
+                http_client=http_client_factory(e) if http_client_factory is not None else None,
+                max_retries=0,
+            )
+            for e in endpoints
+        ]
+        self.active = [0] * len(endpoints)
+        self.requests = [0] * len(endpoints)
+        self.failures = [0] * len(endpoints)
+        self.open_until = [0.0] * len(endpoints)
+
+    def select(self, exclude: Optional[Set[int]] = None) -> Optional[int]:
+        """
+        Pick the endpoint with the lowest load per weight, among healthy endpoints not in exclude.
+        If every breaker is open, the endpoint closest to the end of its cooldown is probed.
+
+        :param exclude: endpoints already tried for this request
+        :return: endpoint index, None if every endpoint was tried
+        """
+        candidates = [i for i in range(len(self.endpoints)) if not exclude or i not in exclude]
+        if not candidates:
+            return None
+
+        now = time.monotonic()
+        healthy = [i for i in candidates if self.open_until[i] <= now]
+        if not healthy:
+            return min(candidates, key=lambda i: self.open_until[i])
+
+        return min(healthy, key=lambda i: ((self.active[i] + 1) / self.endpoints[i].weight, -self.endpoints[i].weight))
+
+    def acquire(self, exclude: Optional[Set[int]] = None) -> Optional[Tuple[int, "AsyncOpenAI"]]:
+        i = self.select(exclude)
+        if i is None:
+            return None
+        self.active[i] += 1
+        self.requests[i] += 1
+        return i, self.clients[i]
+
+    def release(self, i: int) -> None:
+        self.active[i] -= 1
+
+    def success(self, i: int) -> None:
+        self.failures[i] = 0
+
+    def failure(self, i: int) -> None:
+        """
+        Count a failed request towards the circuit breaker of an endpoint
+
+        :param i: endpoint index
+        """
+        self.failures[i] += 1
+        if self.failures[i] >= self.failure_threshold and self.open_until[i] <= time.monotonic():
+            self.open_until[i] = time.monotonic() + self.cooldown
+            logger.warning(
+                "Endpoint %s failed %d times, skipping it for %.0fs",
+                self.endpoints[i].base_url,
+                self.failures[i],
+                self.cooldown,
+            )
+
+    async def close(self) -> None:
+        for client in self.clients:
+            await client.close()
+
+
+def _on_retry(retry_state: RetryCallState) -> None:
+    """
+    tenacity before_sleep hook, report the retry to the instrumentation of the Translator being retried
+
+    :param retry_state: tenacity RetryCallState
+    """
+    translator = retry_state.args[0]
+    name = getattr(retry_state.fn, "__name__", "request")
+    logger.debug("Retrying %s, attempt %d", name, retry_state.attempt_number)
+    translator.instrument.emit(Event(kind="retry", name=translator.name, attempt=retry_state.attempt_number))
+
+
+class FallbackZH(ZH):
+    """
+    Origin text returned for a line the llm failed to translate, never cached or journaled as a translation
+    """
 
 
 class Translator:
+    name = "translate"
+
     def __init__(
-        self, model: str, api_key: str, base_url: str, bangumi_info: Optional[BGM] = None, summary: str = ""
+        self,
+        model: str,
+        api_key: str,
+        base_url: str,
+        bangumi_info: Optional[BGM] = None,
+        summary: str = "",
+        batch_size: int = 1,
+        scheduler: Optional[Scheduler] = None,
+        queue: str = "default",
+        cache: Optional[TranslationCache] = None,
+        client: Optional["AsyncOpenAI"] = None,
+        instrument: Optional[Instrumentation] = None,
+        context: bool = False,
+        hedger: Optional[Hedger] = None,
+        pool: Optional[EndpointPool] = None,
+        refresh_context: Optional[Callable[[ORIGIN], ORIGIN]] = None,
     ) -> None:
         self.model = model
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-        )
-        self.system_prompt = anime_prompt(bangumi_info, summary)
+        self.pool = pool
+        if pool is not None:
+            client = pool.clients[0]
+        self.client = client if client is not None else create_llm_client(api_key, base_url)
+        self.system_prompt = anime_prompt(bangumi_info, summary, context=context)
+        self.batch_system_prompt = anime_prompt(bangumi_info, summary, batch=True, context=context)
+        self.batch_size = max(1, batch_size)
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.queue = queue
+        self.cache = cache
+        self.instrument = instrument if instrument is not None else Instrumentation()
+        self.hedger = hedger
+        # context mode, the translations of the preceding lines are looked up again right before sending
+        self.refresh_context = refresh_context
         self.corner_case = True
 
-    @retry(wait=wait_random(min=3, max=5), stop=stop_after_attempt(5))
-    async def ask(self, question: ORIGIN) -> ZH:
-        if self.corner_case:
-            # blank question
-            if question.origin == "":
-                return ZH(zh="")
-
-            # too long question, return directly
-            if len(question.origin) > 100:
-                return ZH(zh=question.origin)
-
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": question.model_dump_json()},
-        ]
+    async def _create(
+        self,
+        messages: List[Dict[str, str]],
+        key: str = "line",
+        build: Optional[Callable[[], List[Dict[str, str]]]] = None,
+    ) -> Any:
+        """
+        Send one chat completion through the scheduler, hedged if a Hedger is set
+
+        :param messages: chat messages
+        :param key: latency class for hedging, line or batch
+        :param build: rebuilds the messages once the request holds a scheduler slot
+        :return: json content of the response
+        """
+        tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        logger.debug("Sending %s request, ~%d prompt tokens", self.name, tokens)
+
+        if self.hedger is None:
+            response = await self._send(messages, tokens, build=build)
+        else:
+            response = await self._hedged(messages, tokens, key, build=build)
+
+        return json.loads(response.choices[0].message.content)
+
+    async def _send_pool(self, messages: List[Dict[str, str]]) -> Any:
+        """
+        Send one chat completion to the endpoint pool, failing over to the next endpoint on connection errors and 429
+
+        :param messages: chat messages
+        :return: chat completion
+        """
+        import openai
 
+        assert self.pool is not None
+        tried: Set[int] = set()
+        while True:
+            endpoint = self.pool.acquire(tried)
+            assert endpoint is not None
+            i, client = endpoint
+            try:
+                response = await client.chat.completions.create(
+                    model=self.pool.endpoints[i].model or self.model,
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                )
+            except (openai.APIConnectionError, openai.RateLimitError) as e:
+                self.pool.release(i)
+                self.pool.failure(i)
+                tried.add(i)
+                if len(tried) == len(self.pool.endpoints):
+                    raise e
+                logger.warning("Endpoint %s failed: %s, failing over", self.pool.endpoints[i].base_url, e)
+                continue
+            except BaseException:
+                # other errors and cancellation (e.g. a lost hedge) say nothing about the endpoint health
+                self.pool.release(i)
+                raise
+
+            self.pool.release(i)
+            self.pool.success(i)
+            return response
+
+    async def _hedged(
+        self,
+        messages: List[Dict[str, str]],
+        tokens: int,
+        key: str,
+        build: Optional[Callable[[], List[Dict[str, str]]]] = None,
+    ) -> Any:
+        """
+        Send a request, fire a duplicate if it is still running after the hedge delay, the first response wins
+        and the other one is cancelled
+
+        :param messages: chat messages
+        :param tokens: estimated prompt tokens
+        :param key: latency class
+        :param build: rebuilds the messages once a request holds a scheduler slot
+        :return: chat completion
+        """
+        assert self.hedger is not None
+        delay = self.hedger.delay(key)
+        loop = asyncio.get_running_loop()
+        due: asyncio.Future[None] = loop.create_future()
+
+        def _due() -> None:
+            if not due.done():
+                due.set_result(None)
+
+        def _arm() -> None:
+            # the hedge clock starts once the request holds a slot, not while it waits in the scheduler queue
+            if delay is not None:
+                loop.call_later(delay, _due)
+
+        primary = asyncio.ensure_future(self._send(messages, tokens, key, on_start=_arm, build=build))
+        tasks: Set[asyncio.Future[Any]] = {primary}
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model, messages=messages, response_format={"type": "json_object"}
+            if delay is not None:
+                await asyncio.wait({primary, due}, return_when=asyncio.FIRST_COMPLETED)
+                if not primary.done() and self.hedger.allow():
+                    logger.debug("Hedging %s request after %.2fs", self.name, delay)
+                    self.instrument.emit(Event(kind="hedge", name=self.name, elapsed=delay))
+                    tasks.add(asyncio.ensure_future(self._send(messages, tokens, key, build=build)))
+
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedger.wins += 1
+                            self.instrument.emit(Event(kind="hedge_win", name=self.name))
+                        return task.result()
+                if not tasks:
+                    # every request failed, re-raise the last error
+                    return done.pop().result()
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not due.done():
+                due.cancel()
+
+    async def _send(
+        self,
+        messages: List[Dict[str, str]],
+        tokens: int,
+        key: str = "line",
+        on_start: Optional[Callable[[], None]] = None,
+        build: Optional[Callable[[], List[Dict[str, str]]]] = None,
+    ) -> Any:
+        """
+        Send one chat completion through the scheduler
+
+        :param messages: chat messages
+        :param tokens: estimated prompt tokens, charged against the tpm budget
+        :param key: latency class for hedging
+        :param on_start: called once the request holds a scheduler slot
+        :param build: rebuilds the messages once the request holds a scheduler slot, e.g. to pick up the
+            translations done while it was queued
+        :return: chat completion
+        """
+        import openai
+
+        async with self.scheduler.slot(self.queue, tokens):
+            if on_start is not None:
+                on_start()
+            if build is not None:
+                messages = build()
+            t = time.perf_counter()
+            try:
+                if self.pool is None:
+                    response = await self.client.chat.completions.create(
+                        model=self.model, messages=messages, response_format={"type": "json_object"}
+                    )
+                else:
+                    response = await self._send_pool(messages)
+            except openai.RateLimitError as e:
+                retry_after = e.response.headers.get("retry-after")
+                try:
+                    self.scheduler.penalize(float(retry_after) if retry_after else 5.0)
+                except ValueError:
+                    self.scheduler.penalize(5.0)
+                raise e
+
+        elapsed = time.perf_counter() - t
+        if self.hedger is not None:
+            self.hedger.observe(elapsed, key)
+
+        usage = getattr(response, "usage", None)
+        self.instrument.emit(
+            Event(
+                kind="request",
+                name=self.name,
+                elapsed=elapsed,
+                prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                estimated_tokens=tokens,
             )
-            content = json.loads(response.choices[0].message.content)
+        )
+        return response
+
+    def _corner_case(self, question: ORIGIN) -> Optional[ZH]:
+        """
+        Answer the question locally if it doesn't need to be sent to the llm
+
+        :param question: ORIGIN
+        :return: ZH or None if the question should be sent
+        """
+        if not self.corner_case:
+            return None
+
+        # blank question
+        if question.origin == "":
+            return ZH(zh="")
+
+        # too long question, return directly
+        if len(question.origin) > 100:
+            return ZH(zh=question.origin)
+
+        return None
+
+    def _lookup(self, question: ORIGIN, system_prompt: Optional[str] = None) -> Optional[ZH]:
+        """
+        Answer the question without the network, from corner cases or the translation cache
+
+        :param question: ORIGIN
+        :param system_prompt: prompt the answer depends on, default is the single line system prompt
+        :return: ZH or None if the question should be sent
+        """
+        answer = self._corner_case(question)
+        if answer is not None or self.cache is None:
+            return answer
+
+        # batch requests share the cache with single line requests, so always key on the single line prompt
+        cached = self.cache.get(question.origin, self.model, system_prompt or self.system_prompt)
+        self.instrument.emit(Event(kind="cache", name=self.name, hit=cached is not None))
+        return ZH(zh=cached) if cached is not None else None
+
+    def _store(self, question: ORIGIN, answer: ZH, system_prompt: Optional[str] = None) -> None:
+        if self.cache is not None:
+            self.cache.set(question.origin, answer.zh, self.model, system_prompt or self.system_prompt)
+
+    async def ask(self, question: ORIGIN) -> ZH:
+        return await self._ask(question, self.system_prompt)
+
+    @retry(wait=wait_random(min=3, max=5), stop=stop_after_attempt(5), before_sleep=_on_retry)
+    async def _ask(self, question: ORIGIN, system_prompt: str) -> ZH:
+        import openai
+
+        answer = self._lookup(question, system_prompt)
+        if answer is not None:
+            return answer
+
+        def _messages() -> List[Dict[str, str]]:
+            q = self.refresh_context(question) if self.refresh_context is not None else question
+            return [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": q.model_dump_json(exclude_defaults=True)},
+            ]
+
+        try:
+            content = await self._create(_messages(), build=_messages if self.refresh_context is not None else None)
             zh = ZH(**content)
 
         except openai.AuthenticationError as e:
-            print(f"Authentication Error: {e} retrying...")
+            logger.warning("Authentication Error: %s retrying...", e)
             raise e
 
         except openai.APIConnectionError as e:
-            print(f"Connection Error: {e} retrying...")
+            logger.warning("Connection Error: %s retrying...", e)
+            raise e
+
+        except openai.RateLimitError as e:
+            logger.warning("Rate Limit Error: %s retrying...", e)
             raise e
 
         except Exception as e:
-            print(f"Unknown Error: {e} return original question: {question.origin}")
-            return ZH(zh=question.origin)
+            logger.error("Unknown Error: %s return original question: %s", e, question.origin)
+            return FallbackZH(zh=question.origin)
 
+        self._store(question, zh, system_prompt)
         return zh
 
+    async def ask_batch(self, questions: List[ORIGIN]) -> List[ZH]:
+        """
+        Translate a list of questions, packing up to batch_size consecutive lines into one request
+
+        :param questions: list of ORIGIN
+        :return: list of ZH, index-aligned with questions
+        """
+        chunks = chunk(questions, self.batch_size)
+        # awaited in place, the caller sees the answers in the same loop step the slot is released, so a batch
+        # queued behind this one picks them up as context
+        if len(chunks) == 1:
+            return await self._ask_chunk(chunks[0])
+        results = await asyncio.gather(*[self._ask_chunk(c) for c in chunks])
+        return [zh for result in results for zh in result]
+
+    async def _ask_chunk(self, questions: List[ORIGIN]) -> List[ZH]:
+        """
+        Translate one batch, split it in half and retry when the llm returns a mismatched count
+
+        :param questions: list of ORIGIN
+        :return: list of ZH, index-aligned with questions
+        """
+        answers: List[Optional[ZH]] = [self._lookup(q) for q in questions]
+        pending = [i for i, a in enumerate(answers) if a is None]
+
+        if len(pending) == 1:
+            answers[pending[0]] = await self.ask(questions[pending[0]])
+
+        elif len(pending) > 1:
+            # lines inside the batch are each other's context, only the edges carry their neighbors
+            first, last = questions[pending[0]], questions[pending[-1]]
+            zh_batch = await self._request_batch(
+                ORIGIN_BATCH(
+                    origin=[questions[i].origin for i in pending],
+                    context_before=first.context_before,
+                    context_before_zh=first.context_before_zh,
+                    context_after=last.context_after,
+                ),
+                first,
+            )
+
+            if zh_batch is not None and len(zh_batch.zh) == len(pending):
+                for i, text in zip(pending, zh_batch.zh):
+                    answers[i] = ZH(zh=text)
+                    self._store(questions[i], ZH(zh=text))
+            else:
+                logger.info("Batch size mismatch, splitting %d lines and retrying...", len(pending))
+                mid = len(pending) // 2
+                left, right = await asyncio.gather(
+                    self._ask_chunk([questions[i] for i in pending[:mid]]),
+                    self._ask_chunk([questions[i] for i in pending[mid:]]),
+                )
+                for i, answer in zip(pending, left + right):
+                    answers[i] = answer
+
+        return [a if a is not None else FallbackZH(zh=q.origin) for a, q in zip(answers, questions)]
+
+    @retry(wait=wait_random(min=3, max=5), stop=stop_after_attempt(5), before_sleep=_on_retry)
+    async def _request_batch(self, question: ORIGIN_BATCH, first: Optional[ORIGIN] = None) -> Optional[ZH_BATCH]:
+        import openai
+
+        def _messages() -> List[Dict[str, str]]:
+            q = question
+            # the batch carries the translated context of its first line
+            if self.refresh_context is not None and first is not None:
+                q = question.model_copy(update={"context_before_zh": self.refresh_context(first).context_before_zh})
+            return [
+                {"role": "system", "content": self.batch_system_prompt},
+                {"role": "user", "content": q.model_dump_json(exclude_defaults=True)},
+            ]
+
+        try:
+            content = await self._create(
+                _messages(), key="batch", build=_messages if self.refresh_context is not None else None
+            )
+            zh_batch = ZH_BATCH(**content)
+
+        except openai.AuthenticationError as e:
+            logger.warning("Authentication Error: %s retrying...", e)
+            raise e
+
+        except openai.APIConnectionError as e:
+            logger.warning("Connection Error: %s retrying...", e)
+            raise e
+
+        except openai.RateLimitError as e:
+            logger.warning("Rate Limit Error: %s retrying...", e)
+            raise e
+
+        except Exception as e:
+            logger.error("Unknown Error: %s in batch of %d lines", e, len(question.origin))
+            return None
+
+        return zh_batch
+
 
 class Summarizer(Translator):
-    def __init__(self, model: str, api_key: str, base_url: str, bangumi_info: Optional[BGM] = None) -> None:
-        super().__init__(model, api_key, base_url, bangumi_info)
+    name = "summary"
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        base_url: str,
+        bangumi_info: Optional[BGM] = None,
+        scheduler: Optional[Scheduler] = None,
+        queue: str = "default",
+        cache: Optional[TranslationCache] = None,
+        client: Optional["AsyncOpenAI"] = None,
+        instrument: Optional[Instrumentation] = None,
+        pool: Optional[EndpointPool] = None,
+    ) -> None:
+        super().__init__(
+            model,
+            api_key,
+            base_url,
+            bangumi_info,
+            scheduler=scheduler,
+            queue=queue,
+            cache=cache,
+            client=client,
+            instrument=instrument,
+            pool=pool,
+        )
         self.system_prompt = summary_prompt(bangumi_info)
+        self.merge_system_prompt = merge_summary_prompt(bangumi_info)
         self.corner_case = False
+
+    async def summarize(self, lines: List[str], chunk_size: Optional[int] = None) -> ZH:
+        """
+        Summarize an episode, long inputs are split into windows summarized in parallel and then merged
+
+        :param lines: subtitle lines
+        :param chunk_size: max lines per window, None to summarize all lines in one request
+        :return: ZH summary
+        """
+        if chunk_size is None or len(lines) <= chunk_size:
+            return await self.ask(ORIGIN(origin="\n".join(lines)))
+
+        partials = await asyncio.gather(*[self.ask(ORIGIN(origin="\n".join(c))) for c in chunk(lines, chunk_size)])
+        summary = await self.merge([p.zh for p in partials])
+        # merged from the raw lines of a failed window, not a summary to keep
+        if any(isinstance(p, FallbackZH) for p in partials):
+            return FallbackZH(zh=summary.zh)
+        return summary
+
+    async def merge(self, summaries: List[str]) -> ZH:
+        """
+        Merge the partial summaries of consecutive windows into one summary
+
+        :param summaries: partial summaries, in episode order
+        :return: ZH summary
+        """
+        if len(summaries) == 1:
+            return ZH(zh=summaries[0])
+
+        origin = "\n".join(f"{i + 1}. {s}" for i, s in enumerate(summaries))
+        return await self._ask(ORIGIN(origin=origin), self.merge_system_prompt)
+
+
+def chunk(items: List[T], size: int) -> List[List[T]]:
+    """
+    Split a list into consecutive chunks
+
+    :param items: list
+    :param size: max chunk size
+    :return: list of chunks
+    """
+    size = max(1, size)
+    return [items[i : i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from yuisub.instrument import Event, Instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    def __init__(
+        self, name: str, fn: Callable[..., Awaitable[Any]], after: Sequence[str], streams: Sequence[str]
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.after = list(after)
+        self.streams = list(streams)
+        self.start = 0.0
+        self.end = 0.0
+
+
+class StageGraph:
+    def __init__(self, instrument: Optional[Instrumentation] = None) -> None:
+        """
+        Small DAG of async stages, every stage starts as soon as the stages it depends on are done, so independent
+        ones (e.g. bangumi and whisper) overlap. Each stage is timed, and the critical path is reported once run.
+
+        :param instrument: receives a stage event per stage and a critical event per stage on the critical path
+        """
+        self.instrument = instrument if instrument is not None else Instrumentation()
+        self.stages: Dict[str, Stage] = {}
+        self.t0 = 0.0
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Awaitable[Any]],
+        after: Sequence[str] = (),
+        streams: Sequence[str] = (),
+    ) -> None:
+        """
+        Add a stage
+
+        :param name: stage name, also the name of its stage event
+        :param fn: coroutine function, called with the results of the after stages, in order
+        :param after: stages to wait for before starting
+        :param streams: stages this one consumes while they run (e.g. through a queue), it starts without waiting
+            for them but can't end before them
+        """
+        for dep in (*after, *streams):
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}, add the stages in order")
+        self.stages[name] = Stage(name, fn, after, streams)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run every stage, a failing stage cancels the others and its exception is raised
+
+        :return: result of every stage, by name
+        """
+        self.t0 = time.perf_counter()
+        tasks: Dict[str, asyncio.Future[Any]] = {}
+
+        async def _run(stage: Stage) -> Any:
+            args = [await tasks[dep] for dep in stage.after]
+            stage.start = time.perf_counter()
+            try:
+                with self.instrument.stage(stage.name):
+                    return await stage.fn(*args)
+            finally:
+                stage.end = time.perf_counter()
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(_run(stage))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        path = self.critical_path()
+        logger.info("Critical path: %s", " -> ".join(f"{name} {elapsed:.2f}s" for name, elapsed in path))
+        for name, elapsed in path:
+            self.instrument.emit(Event(kind="critical", name=name, elapsed=elapsed))
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def critical_path(self) -> List[Tuple[str, float]]:
+        """
+        Chain of stages that decided the wall time, walked back from the last stage to end through the dependency
+        that ended last, only set after run
+
+        :return: (stage, seconds it added to the wall time) in run order, the seconds sum to the wall time
+        """
+        if not self.stages:
+            return []
+
+        stage: Optional[Stage] = max(self.stages.values(), key=lambda s: s.end)
+        path: List[Tuple[str, float]] = []
+        while stage is not None:
+            deps = [self.stages[dep] for dep in (*stage.after, *stage.streams)]
+            prev = max(deps, key=lambda s: s.end) if deps else None
+            # a stage consuming a stream only adds the time it ran past the end of the stream
+            begin = max(prev.end, stage.start) if prev is not None else self.t0
+            path.append((stage.name, stage.end - begin))
+            stage = prev
+
+        return path[::-1]
@@ -1,22 +1,151 @@
-from typing import Optional
+import re
+from typing import List, Optional
 
 from pydantic import BaseModel
 
 from yuisub.bangumi import BGM
 
+# token budget of the character list in a system prompt, characters named in the episode are always kept
+CHARACTER_TOKEN_BUDGET = 800
+
 
 class ORIGIN(BaseModel):
     origin: str
+    # neighbor lines for context mode, left out of the request when empty
+    context_before: List[str] = []
+    context_before_zh: List[str] = []
+    context_after: List[str] = []
 
 
 class ZH(BaseModel):
     zh: str
 
 
-def anime_prompt(bangumi_info: Optional[BGM] = None, summary: str = "") -> str:
+class ORIGIN_BATCH(BaseModel):
+    origin: List[str]
+    context_before: List[str] = []
+    context_before_zh: List[str] = []
+    context_after: List[str] = []
+
+
+class ZH_BATCH(BaseModel):
+    zh: List[str]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer, CJK characters count as one token, other text as four characters per token
+
+    :param text: text
+    :return: estimated token count
+    """
+    cjk = sum(1 for c in text if ord(c) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def select_characters(characters: str, text: str, budget: Optional[int] = CHARACTER_TOKEN_BUDGET) -> str:
+    """
+    Trim the bangumi character list for a prompt, characters whose name appears in text are kept,
+    the others follow in bangumi order (main characters first) while the list fits in budget
+
+    :param characters: BGM.characters, one "name / chinese name" per line
+    :param text: episode (or window) text
+    :param budget: max estimated tokens of the list, None to keep every character
+    :return: trimmed character list
+    """
+    lines = [c for c in characters.splitlines() if c.strip()]
+    if budget is None:
+        return "".join(f"{c}\n" for c in lines)
+
+    text = text.lower()
+    named = [any(len(n) >= 2 and n.lower() in text for n in re.split(r"[\s/・·=]+", c)) for c in lines]
+
+    used = sum(estimate_tokens(c) for c, n in zip(lines, named) if n)
+    selected = []
+    for c, n in zip(lines, named):
+        if not n:
+            cost = estimate_tokens(c)
+            if used + cost > budget:
+                continue
+            used += cost
+        selected.append(f"{c}\n")
+
+    return "".join(selected)
+
+
+ANIME_EXAMPLE = """
+
+EXAMPLE INPUT:
+{
+    "origin": "止まるんじゃねぇぞ！"
+}
+
+EXAMPLE JSON OUTPUT:
+{
+    "zh": "不要停下来啊！"
+}
+"""
+
+ANIME_BATCH_EXAMPLE = """
+
+输入是按顺序排列的多句台词，请逐句翻译，输出的 zh 列表必须与 origin 列表一一对应，数量和顺序都不能改变，不要合并或拆分句子。
+
+EXAMPLE INPUT:
+{
+    "origin": ["止まるんじゃねぇぞ！", "ああ…分かってる"]
+}
+
+EXAMPLE JSON OUTPUT:
+{
+    "zh": ["不要停下来啊！", "啊……我知道"]
+}
+"""
+
+
+ANIME_CONTEXT_EXAMPLE = """
+
+输入中可能带有上下文：context_before 是这句台词之前的几句原文，context_before_zh 是它们已有的译文（空字符串表示还没有译文），context_after 是之后的几句原文。上下文仅供参考，用来理解被拆开的句子和指代关系，只翻译 origin，不要翻译上下文，也不要把上下文的内容写进译文。
+
+EXAMPLE INPUT:
+{
+    "origin": "言ってたよね",
+    "context_before": ["転校してきた時の自己紹介で"],
+    "context_before_zh": ["转学过来做自我介绍的时候"],
+    "context_after": ["まあ、それはいいけど"]
+}
+
+EXAMPLE JSON OUTPUT:
+{
+    "zh": "你说过的吧"
+}
+"""
+
+ANIME_BATCH_CONTEXT_EXAMPLE = """
+
+输入中可能带有上下文：context_before 是这几句台词之前的几句原文，context_before_zh 是它们已有的译文（空字符串表示还没有译文），context_after 是之后的几句原文。上下文仅供参考，用来理解被拆开的句子和指代关系，只翻译 origin 列表，不要翻译上下文，也不要把上下文的内容写进译文。
+
+EXAMPLE INPUT:
+{
+    "origin": ["言ってたよね", "まあ、それはいいけど"],
+    "context_before": ["転校してきた時の自己紹介で"],
+    "context_before_zh": ["转学过来做自我介绍的时候"],
+    "context_after": ["私の誕生日は4月9日よ"]
+}
+
+EXAMPLE JSON OUTPUT:
+{
+    "zh": ["你说过的吧", "嘛，这个无所谓啦"]
+}
+"""
+
+
+def anime_prompt(
+    bangumi_info: Optional[BGM] = None, summary: str = "", batch: bool = False, context: bool = False
+) -> str:
     if bangumi_info is None:
         bangumi_info = BGM(introduction="", characters="")
 
+    # static instructions and examples first, then per-show and per-episode info, so provider prefix caching hits
     return (
         """
             你的目标是把这集新番的台词翻译成中文，要翻译得自然、流畅和地道，使用贴合二次元的表达方式。
@@ -24,6 +153,8 @@ def anime_prompt(bangumi_info: Optional[BGM] = None, summary: str = "") -> str:
             此外，我可能会给你一些动漫相关的信息和本集的剧情总结。请注意，当人名等专有名词出现时，严格按照我提供的信息进行翻译。
 
             """
+        + (ANIME_BATCH_EXAMPLE if batch else ANIME_EXAMPLE)
+        + ((ANIME_BATCH_CONTEXT_EXAMPLE if batch else ANIME_CONTEXT_EXAMPLE) if context else "")
         + """
     角色列表（日/中）：
 
@@ -35,19 +166,21 @@ def anime_prompt(bangumi_info: Optional[BGM] = None, summary: str = "") -> str:
 
     """
         + summary
-        + """
+    )
+
+
+SUMMARY_EXAMPLE = """
 
 EXAMPLE INPUT:
 {
-    "origin": "止まるんじゃねぇぞ！"
+    "origin": "It is... How do you know that? I think you mentioned it in your introduction when you transferred in. Anyway, that's not important. My birthday is April 9th. I've already turned sixteen. I've already turned sixteen. Anyway, thanks for checking in, Alya. See you tomorrow."
 }
 
 EXAMPLE JSON OUTPUT:
 {
-    "zh": "不要停下来啊！"
+    "zh": "在这部动漫新番中，主角久世政近的邻座是一个名叫艾莉莎的女孩。艾莉莎通常对政近表现出冷漠的态度，但有时她会用俄语小声地向他撒娇。政近实际上拥有母语级别的俄语听力，能够理解艾莉莎的话，但他选择装作听不懂。艾莉莎误以为政近不懂俄语，所以她才会在他面前展示出她真实的一面。两人之间有着一种甜蜜的氛围，但他们都试图隐藏这一点。在对话中，艾莉莎纠正了政近关于她生日的错误认知，告诉他她的生日是4月9日，并且她已经16岁了。这段对话增加了他们之间的亲密感，让人对他们的关系发展充满期待。"
 }
 """
-    )
 
 
 def summary_prompt(bangumi_info: Optional[BGM] = None) -> str:
@@ -61,6 +194,7 @@ def summary_prompt(bangumi_info: Optional[BGM] = None) -> str:
             此外，我会提供给你一些动漫相关的信息，帮助你更好地理解剧情。请注意，当人名等专有名词出现时，严格按照我提供的信息总结。
 
             """
+        + SUMMARY_EXAMPLE
         + """
 
     动漫简介：
@@ -73,16 +207,45 @@ def summary_prompt(bangumi_info: Optional[BGM] = None) -> str:
 
     """
         + bangumi_info.characters
-        + """
+    )
+
+
+MERGE_SUMMARY_EXAMPLE = """
 
 EXAMPLE INPUT:
 {
-    "origin": "It is... How do you know that? I think you mentioned it in your introduction when you transferred in. Anyway, that's not important. My birthday is April 9th. I've already turned sixteen. I've already turned sixteen. Anyway, thanks for checking in, Alya. See you tomorrow."
+    "origin": "1. 政近在学校和艾莉莎讨论她的生日。\n2. 艾莉莎告诉政近她已经16岁了，两人约好明天再见。"
 }
 
 EXAMPLE JSON OUTPUT:
 {
-    "zh": "在这部动漫新番中，主角久世政近的邻座是一个名叫艾莉莎的女孩。艾莉莎通常对政近表现出冷漠的态度，但有时她会用俄语小声地向他撒娇。政近实际上拥有母语级别的俄语听力，能够理解艾莉莎的话，但他选择装作听不懂。艾莉莎误以为政近不懂俄语，所以她才会在他面前展示出她真实的一面。两人之间有着一种甜蜜的氛围，但他们都试图隐藏这一点。在对话中，艾莉莎纠正了政近关于她生日的错误认知，告诉他她的生日是4月9日，并且她已经16岁了。这段对话增加了他们之间的亲密感，让人对他们的关系发展充满期待。"
+    "zh": "政近在学校和艾莉莎聊起她的生日，艾莉莎纠正了他的错误认知，告诉他自己已经16岁了，两人随后约好明天再见。"
 }
 """
+
+
+def merge_summary_prompt(bangumi_info: Optional[BGM] = None) -> str:
+    if bangumi_info is None:
+        bangumi_info = BGM(introduction="", characters="")
+
+    return (
+        """
+            你的目标是把这集新番按时间顺序分段写成的几段剧情总结，合并成一段完整的中文剧情总结，要求简洁明了，不要遗漏重要的细节。
+            我会按顺序给你每一段的总结，请保持剧情的先后顺序，去掉重复的内容。
+            请注意，当人名等专有名词出现时，严格按照我提供的信息总结。
+
+            """
+        + MERGE_SUMMARY_EXAMPLE
+        + """
+
+    动漫简介：
+
+    """
+        + bangumi_info.introduction
+        + """
+
+    角色列表（日/中）：
+
+    """
+        + bangumi_info.characters
     )
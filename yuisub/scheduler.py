@@ -0,0 +1,249 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+
+class RateBudget:
+    def __init__(self, per_minute: int) -> None:
+        """
+        Token bucket refilled continuously, per_minute units per minute
+
+        :param per_minute: budget per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int) -> float:
+        """
+        Seconds to wait until amount can be consumed, 0 if it can be consumed now
+
+        :param amount: units to consume, clamped to the bucket capacity
+        :return: seconds
+        """
+        self._refill()
+        need = min(float(amount), self.capacity)
+        if self.available >= need:
+            return 0.0
+        return (need - self.available) / self.rate
+
+    def consume(self, amount: int) -> None:
+        self._refill()
+        self.available -= min(float(amount), self.capacity)
+
+
+class Scheduler:
+    def __init__(self, max_concurrency: int = 16, rpm: Optional[int] = None, tpm: Optional[int] = None) -> None:
+        """
+        Bounded-concurrency scheduler for llm requests, with optional requests/tokens per minute budget.
+        Waiters are queued per key and served round-robin, so several episodes sharing one scheduler get a fair share.
+
+        :param max_concurrency: max in-flight requests
+        :param rpm: requests per minute budget, None means unlimited
+        :param tpm: tokens per minute budget, None means unlimited
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.rpm = RateBudget(rpm) if rpm else None
+        self.tpm = RateBudget(tpm) if tpm else None
+
+        self._active = 0
+        self._queues: Dict[str, Deque[Tuple[asyncio.Future[None], int]]] = {}
+        self._order: Deque[str] = deque()
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(self, key: str = "default", tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Hold one request slot
+
+        :param key: fair queuing key, e.g. one per episode
+        :param tokens: estimated tokens of the request, charged against the tpm budget
+        """
+        await self.acquire(key, tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, key: str = "default", tokens: int = 0) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._bind(loop)
+        fut: asyncio.Future[None] = loop.create_future()
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._order.append(key)
+        self._queues[key].append((fut, tokens))
+        self._dispatch()
+
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # slot was granted right before cancellation, hand it back
+                self.release()
+            else:
+                self._discard(key, fut)
+            raise
+
+    def release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Pause dispatching, e.g. after the provider answered 429
+
+        :param seconds: pause duration
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Reuse the scheduler on another event loop (e.g. a second asyncio.run), the timer, waiters and slots left
+        by the previous loop can never fire, complete or be released
+
+        :param loop: running loop
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._queues.clear()
+        self._order.clear()
+        self._active = 0
+        self._loop = loop
+
+    def _discard(self, key: str, fut: "asyncio.Future[None]") -> None:
+        queue = self._queues.get(key)
+        if queue is None:
+            return
+        for item in queue:
+            if item[0] is fut:
+                queue.remove(item)
+                break
+        if not queue:
+            del self._queues[key]
+            self._order.remove(key)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.rpm is not None:
+            wait = max(wait, self.rpm.wait_time(1))
+        if self.tpm is not None:
+            wait = max(wait, self.tpm.wait_time(tokens))
+        return wait
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency and self._order:
+            key = self._order[0]
+            queue = self._queues[key]
+            fut, tokens = queue[0]
+
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                self._schedule(wait)
+                return
+
+            queue.popleft()
+            # round-robin, move the key to the back of the line
+            self._order.rotate(-1)
+            if not queue:
+                del self._queues[key]
+                self._order.remove(key)
+
+            if fut.done():
+                continue
+
+            if self.rpm is not None:
+                self.rpm.consume(1)
+            if self.tpm is not None:
+                self.tpm.consume(tokens)
+
+            self._active += 1
+            fut.set_result(None)
+
+    def _schedule(self, wait: float) -> None:
+        if self._timer is not None and not self._timer.cancelled():
+            return
+
+        def _wake() -> None:
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(wait, _wake)
+
+
+class Hedger:
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_ratio: float = 0.1,
+        min_samples: int = 20,
+        window: int = 500,
+    ) -> None:
+        """
+        Latency tracker for hedged llm requests: a request still running after the running p95 latency gets a
+        duplicate, the first response wins. Hedges are capped to max_ratio of all requests.
+
+        :param percentile: latency percentile after which a request is hedged
+        :param max_ratio: max hedged requests / all requests, the extra spend cap
+        :param min_samples: latencies observed before hedging starts
+        :param window: latencies kept per key
+        """
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.window = window
+
+        self.requests = 0
+        self.fired = 0
+        self.wins = 0
+        self.capped = 0
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def delay(self, key: str = "default") -> Optional[float]:
+        """
+        Seconds to wait before hedging a new request
+
+        :param key: latency class, e.g. single line or batch requests
+        :return: seconds, None if there are not enough samples yet
+        """
+        self.requests += 1
+        samples = self._samples.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(self.percentile * (len(ordered) - 1))]
+
+    def allow(self) -> bool:
+        """
+        Whether one more hedge fits in the spend cap, counts it if so
+        """
+        if self.fired + 1 > self.max_ratio * self.requests:
+            self.capped += 1
+            return False
+        self.fired += 1
+        return True
+
+    def observe(self, elapsed: float, key: str = "default") -> None:
+        if key not in self._samples:
+            self._samples[key] = deque(maxlen=self.window)
+        self._samples[key].append(elapsed)
@@ -1,15 +1,38 @@
 import asyncio
-from copy import deepcopy
+import logging
+import re
+import uuid
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
 
+import httpx
 import pysubs2
+from pydantic import BaseModel
 from pysubs2 import Alignment, Color, SSAEvent, SSAFile, SSAStyle
-from tenacity import retry, stop_after_attempt, wait_random
+from tenacity import RetryCallState, retry, stop_after_attempt, wait_random
 
-from yuisub.bangumi import bangumi
-from yuisub.llm import Summarizer, Translator
-from yuisub.prompt import ORIGIN
+from yuisub.bangumi import BGM, BangumiCache, bangumi
+from yuisub.cache import TranslationCache, normalize
+from yuisub.instrument import Event, Instrumentation
+from yuisub.journal import Journal
+from yuisub.llm import EndpointPool, FallbackZH, Summarizer, Translator, chunk, create_llm_client
+from yuisub.prompt import CHARACTER_TOKEN_BUDGET, ORIGIN, select_characters
+from yuisub.scheduler import Hedger, Scheduler
+from yuisub.writer import SubtitleWriter
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+# lines per window when translation is pipelined with partial summaries
+STREAM_WINDOW_SIZE = 100
+
+# ASS override blocks, line breaks / hard spaces, drawing mode, and tags that apply to the whole line
+OVERRIDE_RE = re.compile(r"(\{[^}]*\})")
+BREAK_RE = re.compile(r"\\[Nnh]")
+DRAWING_RE = re.compile(r"\\p[1-9]")
+LINE_TAG_RE = re.compile(r"\\(?:(?:pos|move|org|fade?|i?clip)\(|an?\d)")
 
 PRESET_STYLES: dict[str, SSAStyle] = {
     "zh": SSAStyle(
@@ -42,6 +65,106 @@ PRESET_STYLES: dict[str, SSAStyle] = {
 }
 
 
+class Markup(BaseModel):
+    prefix: str = ""
+    text: str = ""
+    suffix: str = ""
+    drawing: bool = False
+
+
+def strip_markup(text: str) -> Markup:
+    """
+    Split an event text into the plain text sent to the llm and the formatting around it.
+    Tags before and after the text are kept, line-wide tags (\\pos, \\an, \\fad, ...) inside it are moved
+    to the front, other inline tags and line breaks are dropped since they can't be aligned to the translation.
+
+    :param text: ASS event text, pysubs2 already converts SRT markup to ASS tags
+    :return: Markup
+    """
+    tokens = [t for t in OVERRIDE_RE.split(text) if t]
+    if any(OVERRIDE_RE.fullmatch(t) and DRAWING_RE.search(t) for t in tokens):
+        return Markup(drawing=True)
+
+    is_text = [not OVERRIDE_RE.fullmatch(t) and BREAK_RE.sub("", t).strip() != "" for t in tokens]
+    if not any(is_text):
+        return Markup(prefix=text)
+
+    first = is_text.index(True)
+    last = len(tokens) - 1 - is_text[::-1].index(True)
+
+    prefix = "".join(tokens[:first])
+    suffix = "".join(tokens[last + 1 :])
+    plain = []
+    for t in tokens[first : last + 1]:
+        if not OVERRIDE_RE.fullmatch(t):
+            plain.append(t)
+        elif LINE_TAG_RE.search(t):
+            prefix += t
+
+    return Markup(prefix=prefix, text=" ".join(BREAK_RE.sub(" ", "".join(plain)).split()), suffix=suffix)
+
+
+def restore_markup(markup: Markup, zh: str) -> str:
+    """
+    Re-apply the formatting of the origin text to its translation
+
+    :param markup: Markup of the origin text
+    :param zh: translated plain text
+    :return: ASS event text
+    """
+    return f"{markup.prefix}{zh}{markup.suffix}"
+
+
+class TranslationStats(BaseModel):
+    lines: int = 0
+    unique_lines: int = 0
+    dedup_saved: int = 0
+    drawings_skipped: int = 0
+    resumed_lines: int = 0
+    failed_lines: int = 0
+    requests: int = 0
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    estimated_prompt_tokens: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    request_latency: List[float] = []
+    stages: Dict[str, float] = {}
+    # seconds each stage added to the wall time, stages running in the shadow of others are left out
+    critical_path: Dict[str, float] = {}
+
+    def record(self, event: Event) -> None:
+        """
+        Instrumentation callback, accumulate an event into the counters
+
+        :param event: Event
+        """
+        if event.kind == "stage":
+            self.stages[event.name] = self.stages.get(event.name, 0.0) + event.elapsed
+        elif event.kind == "critical":
+            self.critical_path[event.name] = self.critical_path.get(event.name, 0.0) + event.elapsed
+        elif event.kind == "request":
+            self.requests += 1
+            self.prompt_tokens += event.prompt_tokens
+            self.completion_tokens += event.completion_tokens
+            self.estimated_prompt_tokens += event.estimated_tokens
+            self.request_latency.append(event.elapsed)
+        elif event.kind == "retry":
+            self.retries += 1
+        elif event.kind == "hedge":
+            self.hedges += 1
+        elif event.kind == "hedge_win":
+            self.hedge_wins += 1
+        elif event.kind == "cache":
+            if event.hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+
 def advertisement(ad: Optional[str] = None, start: int = 0, end: int = 5000) -> SSAEvent:
     """
     Add advertisement to subtitle
@@ -75,9 +198,29 @@ def load(sub_path: Union[Path, str], encoding: str = "utf-8") -> SSAFile:
     return sub
 
 
-@retry(wait=wait_random(min=3, max=5), stop=stop_after_attempt(5))
+def _retry_translate(retry_state: RetryCallState) -> bool:
+    """
+    Retry translate on any error, unless its input was a stream: a consumed event stream can't be replayed
+
+    :param retry_state: tenacity RetryCallState
+    :return: whether to retry
+    """
+    sub = retry_state.kwargs.get("sub", retry_state.args[0] if retry_state.args else None)
+    return retry_state.outcome is not None and retry_state.outcome.failed and isinstance(sub, SSAFile)
+
+
+async def _aiter(sub: Union[SSAFile, AsyncIterable[SSAEvent]]) -> AsyncIterator[SSAEvent]:
+    if isinstance(sub, SSAFile):
+        for e in sub:
+            yield e
+    else:
+        async for e in sub:
+            yield e
+
+
+@retry(wait=wait_random(min=3, max=5), stop=stop_after_attempt(5), retry=_retry_translate)
 async def translate(
-    sub: SSAFile,
+    sub: Union[SSAFile, AsyncIterable[SSAEvent]],
     model: str,
     api_key: str,
     base_url: str,
@@ -85,11 +228,29 @@ async def translate(
     bangumi_access_token: Optional[str] = None,
     styles: Optional[Dict[str, SSAStyle]] = None,
     ad: Optional[SSAEvent] = advertisement(),  # noqa: B008
+    batch_size: int = 1,
+    scheduler: Optional[Scheduler] = None,
+    cache: Optional[TranslationCache] = None,
+    stats: Optional[TranslationStats] = None,
+    summary_chunk_size: Optional[int] = None,
+    partial_summary: bool = False,
+    bangumi_info: Optional[BGM] = None,
+    bangumi_cache: Optional[BangumiCache] = None,
+    llm_client: Optional["AsyncOpenAI"] = None,
+    bangumi_client: Optional[httpx.AsyncClient] = None,
+    instrument: Optional[Instrumentation] = None,
+    journal_path: Optional[Union[str, Path]] = None,
+    context_size: int = 0,
+    character_budget: Optional[int] = CHARACTER_TOKEN_BUDGET,
+    hedger: Optional[Hedger] = None,
+    pool: Optional[EndpointPool] = None,
+    sub_bilingual: Optional[SSAFile] = None,
+    output: Optional["SubtitleStream"] = None,
 ) -> SSAFile:
     """
     Translate subtitle file to Chinese
 
-    :param sub: origin subtitle
+    :param sub: origin subtitle, or an async stream of events (e.g. from WhisperModel.transcribe_stream)
     :param model: llm model
     :param api_key: llm api_key
     :param base_url: llm base_url
@@ -97,66 +258,372 @@ async def translate(
     :param bangumi_access_token: anime bangumi access token
     :param styles: subtitle styles, default is PRESET_STYLES
     :param ad: add advertisement to subtitle, default is TensoRaws
+    :param batch_size: number of consecutive lines packed into one llm request, default is 1
+    :param scheduler: llm request scheduler, share one between episodes to respect a global limit
+    :param cache: translation memory, consulted before sending a line (or the summary) to the llm
+    :param stats: filled with translation counters, e.g. how many llm calls deduplication saved
+    :param summary_chunk_size: summarize windows of this many lines in parallel and merge them, None for one request
+    :param partial_summary: translate each window with its own summary as soon as it is ready, skip the merge,
+        always on for streamed input, windows default to STREAM_WINDOW_SIZE lines
+    :param bangumi_info: already fetched bangumi info, skips fetching bangumi_url
+    :param bangumi_cache: local cache of bangumi api responses
+    :param llm_client: shared pooled llm client, default is one client opened and closed for this episode
+    :param bangumi_client: shared pooled bangumi client
+    :param instrument: receives stage timings and llm request events, stats is bound to it
+    :param journal_path: checkpoint every translated line to this JSONL file and resume from it on retry or re-run,
+        removed once every line is translated
+    :param context_size: send the K preceding and following lines (and the translations already done) along with
+        each request, with batching only the edges of a batch carry them, 0 to disable
+    :param character_budget: estimated tokens of the bangumi character list in prompts, characters named in the
+        episode are always kept, None to send the whole list
+    :param hedger: duplicate line requests slower than the running p95 latency, share one between episodes
+    :param pool: balance requests over several endpoints instead of base_url, api_key and llm_client
+    :param sub_bilingual: filled with the bilingual subtitle built in the same pass, saves a bilingual() call
+    :param output: write every event as soon as it and the events before it are translated, instead of building
+        the whole subtitle in memory, the returned subtitle is then empty and styles, ad and sub_bilingual are unused
     :return:
     """
-    # pending translation
-    trans_list: List[str] = [s.text for s in sub]
+    # each episode queues fairly on the (possibly shared) scheduler
+    if scheduler is None:
+        scheduler = Scheduler()
+    queue = uuid.uuid4().hex
+
+    instrument = (instrument if instrument is not None else Instrumentation()).bind(
+        stats.record if stats is not None else None
+    )
 
     # get bangumi info asynchronously
-    bangumi_info = await bangumi(bangumi_url, bangumi_access_token) if bangumi_url else None
+    if bangumi_info is None and bangumi_url:
+        with instrument.stage("bangumi"):
+            bangumi_info = await bangumi(bangumi_url, bangumi_access_token, bangumi_cache, bangumi_client)
+
+    # lines and summaries already done by a previous attempt
+    journal = Journal(journal_path, model) if journal_path else None
+    resumed, failed = 0, 0
+
+    # reuse the caller's pooled client, or open one shared by every request of this episode
+    owned_client: Optional["AsyncOpenAI"] = None
+    if llm_client is None and pool is None:
+        llm_client = owned_client = create_llm_client(api_key, base_url)
+
+    # trim the character list to the characters named in these lines, keeps prompts small for big casts
+    def _bangumi_info(lines: List[str]) -> Optional[BGM]:
+        if bangumi_info is None:
+            return None
+        characters = select_characters(bangumi_info.characters, "\n".join(lines), character_budget)
+        return BGM(introduction=bangumi_info.introduction, characters=characters)
 
     # initialize summarizer
-    summarizer = Summarizer(
-        model=model,
-        api_key=api_key,
-        base_url=base_url,
-        bangumi_info=bangumi_info,
-    )
-    print(summarizer.system_prompt)
-
-    # get summary
-    summary = await summarizer.ask(ORIGIN(origin="\n".join(trans_list)))
+    def _summarizer(info: Optional[BGM]) -> Summarizer:
+        summarizer = Summarizer(
+            model=model,
+            api_key=api_key,
+            base_url=base_url,
+            bangumi_info=info,
+            scheduler=scheduler,
+            queue=queue,
+            cache=cache,
+            client=llm_client,
+            instrument=instrument,
+            pool=pool,
+        )
+        logger.debug(summarizer.system_prompt)
+        return summarizer
 
     # initialize translator
-    translator = Translator(
-        model=model,
-        api_key=api_key,
-        base_url=base_url,
-        bangumi_info=bangumi_info,
-        summary=summary.zh,
+    def _translator(summary: str, info: Optional[BGM]) -> Translator:
+        return Translator(
+            model=model,
+            api_key=api_key,
+            base_url=base_url,
+            bangumi_info=info,
+            summary=summary,
+            batch_size=batch_size,
+            scheduler=scheduler,
+            queue=queue,
+            cache=cache,
+            client=llm_client,
+            instrument=instrument,
+            context=context_size > 0,
+            hedger=hedger,
+            pool=pool,
+            refresh_context=_refresh if context_size > 0 else None,
+        )
+
+    # pending translation, plain text only, the markup is restored after translation
+    events: List[SSAEvent] = []
+    markups: List[Markup] = []
+    trans_list: List[str] = []
+
+    # collapse identical lines (OP/ED karaoke, interjections, duplicated layers), translate each text once
+    unique_index: Dict[str, int] = {}
+    unique_list: List[str] = []
+    unique_zh: List[str] = []
+    unique_done: List[bool] = []
+    unique_pos: List[int] = []
+    fan_out: List[int] = []
+
+    # with a streaming output, the events of each unique line still waiting for it (translated or failed)
+    unique_waiting: List[Optional[List[int]]] = []
+
+    def _emit(pos: int) -> None:
+        if output is not None:
+            i = fan_out[pos]
+            output.put(pos, events[pos], restore_markup(markups[pos], unique_zh[i]) if i >= 0 else events[pos].text)
+
+    def _settle(i: int) -> None:
+        waiting, unique_waiting[i] = unique_waiting[i], None
+        for pos in waiting or []:
+            _emit(pos)
+
+    def _add(event: SSAEvent) -> None:
+        markup = strip_markup(event.text)
+        events.append(event)
+        markups.append(markup)
+        trans_list.append(markup.text)
+        # drawings and signs are never sent to the llm
+        if markup.drawing:
+            fan_out.append(-1)
+            _emit(len(events) - 1)
+            return
+        key = normalize(markup.text)
+        if key not in unique_index:
+            unique_index[key] = len(unique_list)
+            unique_list.append(markup.text)
+            unique_zh.append(markup.text)
+            unique_done.append(False)
+            unique_pos.append(len(trans_list) - 1)
+            unique_waiting.append([])
+        fan_out.append(unique_index[key])
+
+        waiting = unique_waiting[fan_out[-1]]
+        if waiting is None:
+            _emit(len(events) - 1)
+        else:
+            waiting.append(len(events) - 1)
+
+    # unique line i, in context mode with the neighbors of its first occurrence
+    def _question(i: int) -> ORIGIN:
+        if context_size <= 0:
+            return ORIGIN(origin=unique_list[i])
+
+        pos = unique_pos[i]
+        before = [p for p in range(pos - 1, -1, -1) if trans_list[p]][:context_size][::-1]
+        after = [p for p in range(pos + 1, len(trans_list)) if trans_list[p]][:context_size]
+        before_zh = [unique_zh[fan_out[p]] if unique_done[fan_out[p]] else "" for p in before]
+
+        return ORIGIN(
+            origin=unique_list[i],
+            context_before=[trans_list[p] for p in before],
+            context_before_zh=before_zh if any(before_zh) else [],
+            context_after=[trans_list[p] for p in after],
+        )
+
+    # the questions are built when the batches start, the lines translated while a batch waits for its
+    # scheduler slot are picked up again right before sending
+    def _refresh(question: ORIGIN) -> ORIGIN:
+        return _question(unique_index[normalize(question.origin)])
+
+    # create translate text task, one task per batch of consecutive lines
+    async def _translate(translator: Translator, indexes: List[int]) -> None:
+        nonlocal failed
+        try:
+            translated_list = await translator.ask_batch([_question(i) for i in indexes])
+        except Exception as e:
+            # keep the origin text of these lines instead of failing the episode, a re-run retries them
+            logger.error("Failed to translate %d lines, keeping the origin text: %s", len(indexes), e)
+            failed += len(indexes)
+            for i in indexes:
+                _settle(i)
+            return
+
+        for i, translated_text in zip(indexes, translated_list):
+            unique_zh[i] = translated_text.zh
+            # the llm gave up on this line, it keeps its origin text and a re-run retries it
+            if isinstance(translated_text, FallbackZH):
+                failed += 1
+                _settle(i)
+                continue
+            logger.info("Translated: %s ---> %s", unique_list[i], translated_text.zh)
+            unique_done[i] = True
+            if journal is not None:
+                journal.put("line", unique_list[i], translated_text.zh)
+            _settle(i)
+
+    async def _translate_all(translator: Translator, indexes: List[int]) -> None:
+        nonlocal resumed
+        if journal is not None:
+            pending = []
+            for i in indexes:
+                zh = journal.get("line", unique_list[i])
+                if zh is None:
+                    pending.append(i)
+                else:
+                    unique_zh[i] = zh
+                    unique_done[i] = True
+                    _settle(i)
+            resumed += len(indexes) - len(pending)
+            indexes = pending
+
+        await asyncio.gather(*[_translate(translator, c) for c in chunk(indexes, translator.batch_size)])
+
+    async def _summarize(lines: List[str], info: Optional[BGM], chunk_size: Optional[int] = None) -> str:
+        lines = [t for t in lines if t]
+        text = "\n".join(lines)
+        summary = journal.get("summary", text) if journal is not None else None
+        if summary is None:
+            answer = await _summarizer(info).summarize(lines, chunk_size)
+            summary = answer.zh
+            if journal is not None and not isinstance(answer, FallbackZH):
+                journal.put("summary", text, summary)
+        return summary
+
+    try:
+        if isinstance(sub, SSAFile) and not partial_summary:
+            for e in sub:
+                _add(e)
+
+            # get summary, map-reduce over windows if summary_chunk_size is set
+            info = _bangumi_info(trans_list)
+            with instrument.stage("summary"):
+                summary = await _summarize(trans_list, info, summary_chunk_size)
+
+            translator = _translator(summary, info)
+            logger.debug(translator.system_prompt if translator.batch_size == 1 else translator.batch_system_prompt)
+
+            with instrument.stage("translate"):
+                await _translate_all(translator, list(range(len(unique_list))))
+
+        else:
+            # translate every window as soon as its lines and its own summary are ready, don't wait for the whole episode
+            window_size = summary_chunk_size or STREAM_WINDOW_SIZE
+            window_tasks: List[asyncio.Future[None]] = []
+
+            async def _window(lines: List[str], indexes: List[int]) -> None:
+                # windows overlap, so per-window stages sum to more than the wall time
+                info = _bangumi_info(lines)
+                with instrument.stage("summary"):
+                    summary = await _summarize(lines, info)
+                with instrument.stage("translate"):
+                    await _translate_all(_translator(summary, info), indexes)
+
+            def _flush(line_start: int, unique_start: int) -> None:
+                lines, indexes = trans_list[line_start:], list(range(unique_start, len(unique_list)))
+                window_tasks.append(asyncio.ensure_future(_window(lines, indexes)))
+
+            line_start, unique_start = 0, 0
+            async for e in _aiter(sub):
+                _add(e)
+                if len(trans_list) - line_start >= window_size:
+                    _flush(line_start, unique_start)
+                    line_start, unique_start = len(trans_list), len(unique_list)
+
+            if len(trans_list) > line_start:
+                _flush(line_start, unique_start)
+
+            await asyncio.gather(*window_tasks)
+
+    except BaseException:
+        if journal is not None:
+            journal.close()
+        raise
+
+    finally:
+        # close the client opened for this episode, a shared one belongs to the caller
+        if owned_client is not None:
+            await owned_client.close()
+
+    if journal is not None:
+        if failed:
+            logger.warning("%d lines failed, keeping journal %s to resume them", failed, journal.path)
+            journal.close()
+        else:
+            journal.remove()
+
+    drawings = fan_out.count(-1)
+    dedup_saved = len(trans_list) - drawings - len(unique_list)
+    logger.info("Deduplicated %d lines to %d, saved %d llm calls", len(trans_list), len(unique_list), dedup_saved)
+    if stats is not None:
+        stats.lines = len(trans_list)
+        stats.unique_lines = len(unique_list)
+        stats.dedup_saved = dedup_saved
+        stats.drawings_skipped = drawings
+        stats.resumed_lines = resumed
+        stats.failed_lines = failed
+
+    if cache is not None:
+        logger.info("Translation cache: %d hits, %d misses", cache.hits, cache.misses)
+
+    # every event is already written
+    if output is not None:
+        sub_zh = SSAFile()
+        sub_zh.styles = styles if styles is not None else PRESET_STYLES
+        return sub_zh
+
+    # fan the translations back out to every matching event, with its own markup
+    trans_list = [restore_markup(m, unique_zh[i]) if i >= 0 else e.text for i, m, e in zip(fan_out, markups, events)]
+
+    # gen Chinese subtitle, and the bilingual one in the same pass if asked for
+    with instrument.stage("compose"):
+        sub_zh, sub_bi = compose(events, trans_list, styles=styles, ad=ad)
+    if sub_bilingual is not None:
+        sub_bilingual.styles = sub_bi.styles
+        sub_bilingual.events = sub_bi.events
+
+    return sub_zh
+
+
+def _restyle(e: SSAEvent, style: str, text: str) -> SSAEvent:
+    # a field by field copy, deepcopy is an order of magnitude slower on big karaoke/typesetting files
+    return SSAEvent(
+        start=e.start,
+        end=e.end,
+        text=text,
+        marked=e.marked,
+        layer=e.layer,
+        style=style,
+        name=e.name,
+        marginl=e.marginl,
+        marginr=e.marginr,
+        marginv=e.marginv,
+        effect=e.effect,
+        type=e.type,
     )
-    print(translator.system_prompt)
 
-    # create translate text task
-    async def _translate(index: int) -> None:
-        nonlocal trans_list
-        translated_text = await translator.ask(ORIGIN(origin=trans_list[index]))
-        print(f"Translated: {trans_list[index]} ---> {translated_text.zh}")
-        trans_list[index] = translated_text.zh
 
-    # start translation tasks
-    tasks = [_translate(i) for i in range(len(sub))]
-    await asyncio.gather(*tasks)
+def compose(
+    events: Sequence[SSAEvent],
+    texts: Sequence[str],
+    styles: Optional[Dict[str, SSAStyle]] = None,
+    ad: Optional[SSAEvent] = None,
+) -> Tuple[SSAFile, SSAFile]:
+    """
+    Build the Chinese and the bilingual subtitle in one pass, the origin events are never mutated
 
-    # gen Chinese subtitle
+    :param events: origin events, e.g. an SSAFile
+    :param texts: Chinese text of every origin event
+    :param styles: subtitle styles, default is PRESET_STYLES
+    :param ad: advertisement, put before the Chinese events
+    :return: Chinese subtitle and bilingual subtitle, the Chinese events are shared between both
+    """
     if styles is None:
         styles = PRESET_STYLES
 
     sub_zh = SSAFile()
     sub_zh.styles = styles
+    sub_bilingual = SSAFile()
+    sub_bilingual.styles = styles
 
-    # add advertisement
     if ad:
         sub_zh.append(ad)
 
-    # copy origin subtitle and replace text with translated text
-    sub_temp = deepcopy(sub)
-    for i, e in enumerate(sub_temp):
-        e.style = "zh"
-        e.text = trans_list[i]
-        sub_zh.append(e)
+    for e, text in zip(events, texts):
+        sub_bilingual.append(_restyle(e, "origin", e.text))
+        sub_zh.append(_restyle(e, "zh", text))
 
-    return sub_zh
+    sub_bilingual.events.extend(sub_zh.events)
+
+    return sub_zh, sub_bilingual
 
 
 async def bilingual(
@@ -165,7 +632,7 @@ async def bilingual(
     styles: Optional[Dict[str, SSAStyle]] = None,
 ) -> SSAFile:
     """
-    Generate bilingual subtitle file asynchronously
+    Generate bilingual subtitle file asynchronously, neither input is mutated
 
     :param sub_origin: Origin subtitle
     :param sub_zh: Chinese subtitle
@@ -181,11 +648,91 @@ async def bilingual(
     sub_bilingual.styles = styles
 
     for e in sub_origin:
-        e.style = "origin"
-        sub_bilingual.append(e)
+        sub_bilingual.append(_restyle(e, "origin", e.text))
 
-    # notice: deepcopy is necessary for the zh subtitle if you wanna edit it in bilingual!
-    for e in sub_zh:
-        sub_bilingual.append(e)
+    # notice: the zh events are shared with sub_zh, copy them before editing one of the two!
+    sub_bilingual.events.extend(sub_zh.events)
 
     return sub_bilingual
+
+
+class SubtitleStream:
+    def __init__(
+        self,
+        zh_path: Optional[Union[str, Path]] = None,
+        bilingual_path: Optional[Union[str, Path]] = None,
+        styles: Optional[Dict[str, SSAStyle]] = None,
+        ad: Optional[SSAEvent] = advertisement(),  # noqa: B008
+    ) -> None:
+        """
+        Write the Chinese and bilingual subtitles while the episode is being translated. Lines finish out of order,
+        a reorder buffer holds them until every event before them is done, so both files are always a valid prefix
+        of the episode. The bilingual file interleaves every origin event with its translation (after the ad), unlike
+        compose() which lists every origin event first, the same events in another order.
+
+        :param zh_path: Chinese subtitle path, ass, ssa or srt
+        :param bilingual_path: bilingual subtitle path, ass, ssa or srt
+        :param styles: subtitle styles, default is PRESET_STYLES
+        :param ad: advertisement, written first
+        """
+        if styles is None:
+            styles = PRESET_STYLES
+
+        self.zh = SubtitleWriter(zh_path, styles) if zh_path else None
+        self.bilingual = SubtitleWriter(bilingual_path, styles) if bilingual_path else None
+        self.written = 0
+        self._buffer: Dict[int, SSAEvent] = {}
+        self._texts: Dict[int, str] = {}
+
+        if ad:
+            for writer in (self.zh, self.bilingual):
+                if writer is not None:
+                    writer.write([ad])
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def put(self, index: int, event: SSAEvent, zh: str) -> None:
+        """
+        Hand over a finished event, it is written once every event before it is
+
+        :param index: position of the event in the episode
+        :param event: origin event, not mutated
+        :param zh: translated event text
+        """
+        # a retried episode hands over the events already written again
+        if index < self.written or index in self._buffer:
+            return
+
+        self._buffer[index] = event
+        self._texts[index] = zh
+        if index != self.written:
+            return
+
+        zh_events: List[SSAEvent] = []
+        bilingual_events: List[SSAEvent] = []
+        while self.written in self._buffer:
+            e, text = self._buffer.pop(self.written), self._texts.pop(self.written)
+            zh_event = _restyle(e, "zh", text)
+            zh_events.append(zh_event)
+            bilingual_events.extend((_restyle(e, "origin", e.text), zh_event))
+            self.written += 1
+
+        if self.zh is not None:
+            self.zh.write(zh_events)
+        if self.bilingual is not None:
+            self.bilingual.write(bilingual_events)
+
+    def close(self) -> None:
+        if self._buffer:
+            logger.warning("Closing subtitle stream with %d events never written", len(self._buffer))
+        for writer in (self.zh, self.bilingual):
+            if writer is not None:
+                writer.close()
+
+    def __enter__(self) -> "SubtitleStream":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -1,10 +1,28 @@
+import asyncio
+import logging
+import multiprocessing
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple, Union
 
+import httpx
 import pysubs2
 
-from yuisub.sub import advertisement, bilingual, load, translate
+from yuisub.bangumi import BGM, BangumiCache, bangumi, create_bangumi_client
+from yuisub.cache import TranslationCache
+from yuisub.client import create_http_client
+from yuisub.instrument import Instrumentation
+from yuisub.llm import Endpoint, EndpointPool, create_llm_client
+from yuisub.pipeline import StageGraph
+from yuisub.prompt import CHARACTER_TOKEN_BUDGET
+from yuisub.scheduler import Hedger, Scheduler
+from yuisub.sub import SubtitleStream, TranslationStats, advertisement, load, translate
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
 
 
 class SubtitleTranslator:
@@ -17,6 +35,30 @@ class SubtitleTranslator:
         bangumi_access_token: Optional[str] = None,
         torch_device: Optional[str] = None,
         whisper_model: Optional[str] = None,
+        batch_size: int = 1,
+        max_concurrency: int = 16,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        cache_path: Optional[Union[str, Path]] = None,
+        summary_chunk_size: Optional[int] = None,
+        partial_summary: bool = False,
+        stream_audio: bool = False,
+        bangumi_cache_dir: Optional[Union[str, Path]] = None,
+        bangumi_offline: bool = False,
+        http2: bool = False,
+        max_connections: Optional[int] = 100,
+        max_keepalive_connections: Optional[int] = 20,
+        keepalive_expiry: Optional[float] = 30.0,
+        instrument: Optional[Instrumentation] = None,
+        context_size: int = 0,
+        character_budget: Optional[int] = CHARACTER_TOKEN_BUDGET,
+        hedge: bool = False,
+        hedge_max_ratio: float = 0.1,
+        endpoints: Optional[List[Endpoint]] = None,
+        transcribe_workers: int = 0,
+        vad: bool = False,
+        audio_cache_dir: Optional[Union[str, Path]] = None,
+        audio_cache_size: int = 4 * 1024**3,
     ) -> None:
         """
         Subtitle Translator Class
@@ -27,7 +69,33 @@ class SubtitleTranslator:
         :param bangumi_url: bangumi url
         :param bangumi_access_token: bangumi access token
         :param torch_device: torch device
-        :param whisper_model: whisper model name
+        :param whisper_model: whisper model name, loaded on first use and shared by every translator of the process
+        :param batch_size: number of consecutive lines packed into one llm request
+        :param max_concurrency: max in-flight llm requests, shared by all get_subtitles calls
+        :param rpm: llm requests per minute budget
+        :param tpm: llm tokens per minute budget
+        :param cache_path: translation memory sqlite path, None to disable the cache
+        :param summary_chunk_size: summarize windows of this many lines in parallel, None for one request
+        :param partial_summary: translate each window with its own summary instead of waiting for the merged one
+        :param stream_audio: translate whisper segments while the rest of the audio is still being transcribed
+        :param bangumi_cache_dir: directory to cache bangumi api responses in, None to disable the cache
+        :param bangumi_offline: serve bangumi info only from bangumi_cache_dir
+        :param http2: use HTTP/2 for llm and bangumi requests, needs the optional h2 package
+        :param max_connections: max pooled connections per client
+        :param max_keepalive_connections: max idle connections kept alive per client
+        :param keepalive_expiry: seconds an idle connection is kept alive
+        :param instrument: receives stage timings, llm request latency, token usage, retries and cache lookups
+        :param context_size: number of preceding and following lines sent along with each request, 0 to disable
+        :param character_budget: estimated tokens of the bangumi character list in prompts, None for the whole list
+        :param hedge: duplicate line requests still running after the p95 latency, the first response wins
+        :param hedge_max_ratio: max share of duplicated requests, caps the extra spend of hedging
+        :param endpoints: balance requests over these endpoints (weights, circuit breaking, failover),
+            model is the default of endpoints without one, base_url and api_key are not used
+        :param transcribe_workers: worker processes transcribing audio in parallel, each loads its own copy of
+            the whisper model, 0 to transcribe in a thread of this process
+        :param vad: split the audio at silences and transcribe the speech chunks in parallel on transcribe_workers
+        :param audio_cache_dir: directory to cache decoded audio in, None to decode every time
+        :param audio_cache_size: max size of the audio cache in bytes, least recently used files are evicted
         """
         self.model = model
         self.api_key = api_key
@@ -36,12 +104,44 @@ class SubtitleTranslator:
         self.bangumi_access_token = bangumi_access_token
         self.torch_device = torch_device
         self.whisper_model = whisper_model
+        self.batch_size = batch_size
+        self.scheduler = Scheduler(max_concurrency=max_concurrency, rpm=rpm, tpm=tpm)
+        self.cache = TranslationCache(cache_path) if cache_path else None
+        self.summary_chunk_size = summary_chunk_size
+        self.partial_summary = partial_summary
+        self.stream_audio = stream_audio
+        self.bangumi_cache = BangumiCache(bangumi_cache_dir, offline=bangumi_offline) if bangumi_cache_dir else None
+        self.bangumi_info: Optional[BGM] = None
+        self._bangumi_lock: Optional[asyncio.Lock] = None
+        self._bangumi_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http2 = http2
+        self.limits: Dict[str, Any] = {
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+        }
+        self.llm_client: Optional["AsyncOpenAI"] = None
+        self.bangumi_client: Optional[httpx.AsyncClient] = None
+        self.instrument = instrument if instrument is not None else Instrumentation()
+        self.context_size = context_size
+        self.character_budget = character_budget
+        self.hedger = Hedger(max_ratio=hedge_max_ratio) if hedge else None
+        self.endpoints = endpoints
+        self.pool: Optional[EndpointPool] = None
+        # set by open(), clients of a closed instance only live for one get_subtitles call
+        self.opened = False
+        self.transcribe_workers = transcribe_workers
+        self.transcribe_executor: Optional[ProcessPoolExecutor] = None
+        self.vad = vad
+        if vad and transcribe_workers <= 0:
+            # the chunks share the one model of this process, which decodes one chunk at a time
+            logger.warning("vad without transcribe_workers only skips the silences, the chunks aren't parallel")
         self.whisper_model_instance = None
 
         if self.whisper_model:
             import torch
 
-            from yuisub.a2t import WhisperModel
+            from yuisub.a2t import AudioCache, WhisperModel
 
             if self.torch_device:
                 device = self.torch_device
@@ -51,18 +151,130 @@ class SubtitleTranslator:
                     if sys.platform == "darwin":
                         device = "mps" if torch.backends.mps.is_available() else "cpu"
                 except Exception:
-                    print("torch device failed to auto select, using cpu instead")
+                    logger.warning("torch device failed to auto select, using cpu instead")
                     device = "cpu"
 
-            whisper_model_instance = WhisperModel(name=self.whisper_model, device=device)
+            audio_cache = AudioCache(audio_cache_dir, max_size=audio_cache_size) if audio_cache_dir else None
+            whisper_model_instance = WhisperModel(name=self.whisper_model, device=device, audio_cache=audio_cache)
             self.whisper_model_instance = whisper_model_instance
 
+    async def __aenter__(self) -> "SubtitleTranslator":
+        self.open()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+    def open(self) -> None:
+        """
+        Create the pooled llm and bangumi clients, shared by every episode until close()
+        """
+        for name, value in self._connect().items():
+            setattr(self, name, value)
+        self.opened = True
+
+    async def close(self) -> None:
+        """
+        Close the pooled clients
+        """
+        await self._disconnect(
+            {
+                "llm_client": self.llm_client,
+                "pool": self.pool,
+                "bangumi_client": self.bangumi_client,
+                "transcribe_executor": self.transcribe_executor,
+            }
+        )
+        self.llm_client = None
+        self.pool = None
+        self.bangumi_client = None
+        self.transcribe_executor = None
+        self.opened = False
+
+    def _connect(self) -> Dict[str, Any]:
+        """
+        Create the llm and bangumi clients and the transcription workers this instance doesn't have yet
+
+        :return: the created ones, by attribute name
+        """
+        created: Dict[str, Any] = {}
+        if self.endpoints:
+            if self.pool is None:
+                created["pool"] = EndpointPool(
+                    self.endpoints, http_client_factory=lambda e: create_http_client(http2=self.http2, **self.limits)
+                )
+        elif self.llm_client is None:
+            http_client = create_http_client(http2=self.http2, **self.limits)
+            created["llm_client"] = create_llm_client(self.api_key, self.base_url, http_client=http_client)
+
+        if self.bangumi_client is None and self.bangumi_url:
+            created["bangumi_client"] = create_bangumi_client(
+                self.bangumi_access_token, http2=self.http2, **self.limits
+            )
+
+        # cuda and torch don't survive fork, workers are spawned (lazily, on the first transcription)
+        if self.transcribe_executor is None and self.transcribe_workers > 0:
+            created["transcribe_executor"] = ProcessPoolExecutor(
+                self.transcribe_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        return created
+
+    @staticmethod
+    async def _disconnect(clients: Dict[str, Any]) -> None:
+        """
+        Close clients created by _connect
+
+        :param clients: clients by attribute name, None ones are skipped
+        """
+        if clients.get("llm_client") is not None:
+            await clients["llm_client"].close()
+
+        if clients.get("pool") is not None:
+            await clients["pool"].close()
+
+        if clients.get("bangumi_client") is not None:
+            await clients["bangumi_client"].aclose()
+
+        if clients.get("transcribe_executor") is not None:
+            clients["transcribe_executor"].shutdown(wait=False, cancel_futures=True)
+
+    async def get_bangumi(self, bangumi_client: Optional[httpx.AsyncClient] = None) -> Optional[BGM]:
+        """
+        Fetch bangumi info once and reuse it for every episode translated by this instance
+
+        :param bangumi_client: client to fetch with, default is the pooled one
+        :return: BGM or None if bangumi_url is not set
+        """
+        if not self.bangumi_url:
+            return None
+
+        # a lock is bound to the event loop it's first awaited in, every asyncio.run gets its own
+        loop = asyncio.get_running_loop()
+        if self._bangumi_lock is None or self._bangumi_loop is not loop:
+            self._bangumi_lock = asyncio.Lock()
+            self._bangumi_loop = loop
+
+        async with self._bangumi_lock:
+            if self.bangumi_info is None:
+                self.bangumi_info = await bangumi(
+                    self.bangumi_url,
+                    self.bangumi_access_token,
+                    self.bangumi_cache,
+                    bangumi_client if bangumi_client is not None else self.bangumi_client,
+                )
+
+        return self.bangumi_info
+
     async def get_subtitles(
         self,
         sub: Optional[Union[str, Path, pysubs2.SSAFile]] = None,
         audio: Optional[Union[str, Any]] = None,
         styles: Optional[Dict[str, pysubs2.SSAStyle]] = None,
         ad: Optional[pysubs2.SSAEvent] = advertisement(),  # noqa: B008
+        stats: Optional[TranslationStats] = None,
+        journal_path: Optional[Union[str, Path]] = None,
+        output: Optional[SubtitleStream] = None,
     ) -> Tuple[pysubs2.SSAFile, pysubs2.SSAFile]:
         """
         Get Translated Subtitles and Bilingual Subtitles from Subtitle or Audio
@@ -71,33 +283,120 @@ class SubtitleTranslator:
         :param audio: audio file path or numpy array or torch tensor
         :param styles: subtitle styles, default is PRESET_STYLES
         :param ad: ad: add advertisement to subtitle, default is TensoRaws
+        :param stats: filled with translation counters and stage timings
+        :param journal_path: checkpoint translated lines to this file, a re-run resumes from it
+        :param output: write both subtitles while translating instead of returning them, the returned ones are empty
         :return: ZH Subtitles and Bilingual Subtitles
         """
+        instrument = self.instrument.bind(stats.record if stats is not None else None)
+
+        if not sub and not audio:
+            raise ValueError("Either audio or sub must be provided")
+
+        whisper_model = self.whisper_model_instance
+        if not sub and not whisper_model:
+            raise ValueError("Whisper model is not loaded, please initialize it first")
+
+        # bangumi doesn't depend on the input, it's fetched while the subtitle is loaded or the audio transcribed
+        graph = StageGraph(instrument)
+
+        # pooled clients of an open instance, or ones created for this call and closed at its end, clients are bound
+        # to the event loop they're created in and a later asyncio.run can't reuse them
+        clients: Dict[str, Any] = {
+            "llm_client": self.llm_client,
+            "pool": self.pool,
+            "bangumi_client": self.bangumi_client,
+            "transcribe_executor": self.transcribe_executor,
+        }
+        owned: Dict[str, Any] = {}
+
+        async def _open() -> None:
+            if not self.opened:
+                owned.update(self._connect())
+                clients.update(owned)
+
+        graph.add("open", _open)
+        graph.add("bangumi", lambda _: self.get_bangumi(clients["bangumi_client"]), after=["open"])
+
+        # summary and translation, the bilingual subtitle is built in the same pass
+        sub_bilingual = pysubs2.SSAFile()
+
+        async def _llm(
+            source: Union[pysubs2.SSAFile, AsyncIterable[pysubs2.SSAEvent]], bangumi_info: Optional[BGM]
+        ) -> pysubs2.SSAFile:
+            return await translate(
+                sub=source,
+                model=self.model,
+                api_key=self.api_key,
+                base_url=self.base_url,
+                bangumi_url=self.bangumi_url,
+                bangumi_access_token=self.bangumi_access_token,
+                styles=styles,
+                ad=ad,
+                batch_size=self.batch_size,
+                scheduler=self.scheduler,
+                cache=self.cache,
+                stats=stats,
+                summary_chunk_size=self.summary_chunk_size,
+                partial_summary=self.partial_summary,
+                bangumi_info=bangumi_info,
+                bangumi_cache=self.bangumi_cache,
+                llm_client=clients["llm_client"],
+                bangumi_client=clients["bangumi_client"],
+                instrument=instrument,
+                journal_path=journal_path,
+                context_size=self.context_size,
+                character_budget=self.character_budget,
+                hedger=self.hedger,
+                pool=clients["pool"],
+                sub_bilingual=sub_bilingual,
+                output=output,
+            )
 
         if sub:
-            if isinstance(sub, (str, Path)):
-                sub = load(sub)
+            origin = sub
+
+            async def _load() -> pysubs2.SSAFile:
+                # parsed in a thread, a big file doesn't hold up the bangumi request
+                return await asyncio.to_thread(load, origin) if isinstance(origin, (str, Path)) else origin
+
+            graph.add("load", _load)
+            graph.add("llm", _llm, after=["load", "bangumi"])
+
+        elif self.stream_audio:
+            assert whisper_model is not None
+            queue: asyncio.Queue[Optional[pysubs2.SSAEvent]] = asyncio.Queue()
+
+            async def _stream(_: None) -> None:
+                # transcription starts right away, translation picks the events up once bangumi is there
+                async for event in whisper_model.transcribe_stream(audio=audio):
+                    queue.put_nowait(event)
+                queue.put_nowait(None)
+
+            async def _events() -> AsyncIterator[pysubs2.SSAEvent]:
+                while (event := await queue.get()) is not None:
+                    yield event
+
+            async def _llm_stream(bangumi_info: Optional[BGM]) -> pysubs2.SSAFile:
+                return await _llm(_events(), bangumi_info)
 
-        elif audio:
-            if not self.whisper_model_instance:
-                raise ValueError("Whisper model is not loaded, please initialize it first")
-            sub = self.whisper_model_instance.transcribe(audio=audio)
+            graph.add("whisper", _stream, after=["open"])
+            graph.add("llm", _llm_stream, after=["bangumi"], streams=["whisper"])
 
         else:
-            raise ValueError("Either audio or sub must be provided")
+            assert whisper_model is not None
+
+            async def _transcribe(_: None) -> pysubs2.SSAFile:
+                if self.vad:
+                    return await whisper_model.atranscribe_chunked(audio=audio, executor=clients["transcribe_executor"])
+                return await whisper_model.atranscribe(audio=audio, executor=clients["transcribe_executor"])
+
+            graph.add("whisper", _transcribe, after=["open"])
+            graph.add("llm", _llm, after=["whisper", "bangumi"])
+
+        try:
+            sub_zh = (await graph.run())["llm"]
+        finally:
+            await self._disconnect(owned)
 
-        sub_zh = await translate(
-            sub=sub,
-            model=self.model,
-            api_key=self.api_key,
-            base_url=self.base_url,
-            bangumi_url=self.bangumi_url,
-            bangumi_access_token=self.bangumi_access_token,
-            styles=styles,
-            ad=ad,
-        )
-        sub_bilingual = await bilingual(
-            sub_origin=sub,
-            sub_zh=sub_zh,
-        )
         return sub_zh, sub_bilingual
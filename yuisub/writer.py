@@ -0,0 +1,80 @@
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+from pysubs2 import SSAEvent, SSAFile, SSAStyle
+from pysubs2.formats import get_format_identifier
+
+STREAM_FORMATS = ("ass", "ssa", "srt")
+
+# start of an srt cue, pysubs2 numbers every rendered chunk from 1
+SRT_CUE_RE = re.compile(r"^\d+(?=\n\d+:\d\d:\d\d,\d{3} --> )", re.MULTILINE)
+
+
+class SubtitleWriter:
+    def __init__(
+        self,
+        path: Union[str, Path],
+        styles: Optional[Dict[str, SSAStyle]] = None,
+        format_: Optional[str] = None,
+        encoding: str = "utf-8",
+    ) -> None:
+        """
+        Write a subtitle file incrementally, events are appended (and flushed) as they come, in the given order.
+        Every chunk is rendered by pysubs2, so the file matches SSAFile.save() of the same events.
+
+        :param path: output path
+        :param styles: subtitle styles
+        :param format_: ass, ssa or srt, default is guessed from the path suffix
+        :param encoding: output encoding
+        """
+        self.path = Path(path)
+        self.format = format_ or get_format_identifier(self.path.suffix)
+        if self.format not in STREAM_FORMATS:
+            raise ValueError(f"Can't stream {self.format} subtitles, use one of {', '.join(STREAM_FORMATS)}")
+
+        self._sub = SSAFile()
+        if styles is not None:
+            self._sub.styles = styles
+
+        # everything up to the [Events] format line
+        self._header = self._sub.to_string(self.format) if self.format != "srt" else ""
+        self._count = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = self.path.open("w", encoding=encoding)
+        self.file.write(self._header)
+        self.file.flush()
+
+    def write(self, events: Iterable[SSAEvent]) -> None:
+        """
+        Append events to the file
+
+        :param events: events, in output order
+        """
+        self._sub.events = list(events)
+        if not self._sub.events:
+            return
+
+        text = self._sub.to_string(self.format)
+        if self.format == "srt":
+            text = SRT_CUE_RE.sub(self._renumber, text)
+        else:
+            text = text[len(self._header) :]
+
+        self._sub.events = []
+        self.file.write(text)
+        self.file.flush()
+
+    def _renumber(self, match: "re.Match[str]") -> str:
+        self._count += 1
+        return str(self._count)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "SubtitleWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()